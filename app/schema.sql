@@ -5,7 +5,12 @@ CREATE TABLE IF NOT EXISTS documents (
   id INTEGER PRIMARY KEY,
   path TEXT NOT NULL UNIQUE,
   filename TEXT NOT NULL,
-  created_at TEXT DEFAULT CURRENT_TIMESTAMP
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  title TEXT,
+  model_no TEXT,
+  category TEXT,
+  subcategory TEXT,
+  sha256 TEXT
 );
 
 CREATE TABLE IF NOT EXISTS pages (
@@ -14,10 +19,31 @@ CREATE TABLE IF NOT EXISTS pages (
   page_no INTEGER NOT NULL,
   text TEXT NOT NULL,
   thumb_path TEXT,
+  key_text TEXT,
+  left_titles_json TEXT,
+  left_nr TEXT,
+  left_scale TEXT,
+  left_confidence REAL,
+  left_source TEXT,
+  left_titles_json_v2 TEXT,
+  left_nr_v2 TEXT,
+  left_scale_v2 TEXT,
+  left_confidence_v2 REAL,
+  left_source_v2 TEXT,
+  left_search_text_v2 TEXT,
+  phash TEXT,
+  lqip TEXT,
+  aspect REAL,
   FOREIGN KEY(document_id) REFERENCES documents(id),
   UNIQUE(document_id, page_no)
 );
 
+-- samlingsfiltre (?series=&sub=) i browse og søgning.
+-- pages(document_id) dækkes allerede af UNIQUE(document_id, page_no).
+CREATE INDEX IF NOT EXISTS documents_collection ON documents(category, subcategory);
+-- samme PDF importeres kun én gang (NULL = ikke hashet endnu)
+CREATE UNIQUE INDEX IF NOT EXISTS documents_sha256 ON documents(sha256);
+
 CREATE VIRTUAL TABLE IF NOT EXISTS page_fts USING fts5(
   text,
   document_id UNINDEXED,
@@ -55,3 +81,225 @@ CREATE TABLE IF NOT EXISTS document_tags (
   FOREIGN KEY(document_id) REFERENCES documents(id),
   FOREIGN KEY(tag_id) REFERENCES tags(id)
 );
+
+-- ---------- page_labels: visningslabel beregnet ved skrivning ----------
+-- Samme regler som den gamle _label_from_row i app/web.py:
+-- titler v2 -> v1 -> "(mangler titel)", nr/skala v2 -> v1, "Nr."-prefix på nr.
+-- Holdes i SQL (ikke Python), så triggerne også virker når labels rettes
+-- direkte i sqlite3.
+
+CREATE VIEW IF NOT EXISTS page_labels_src AS
+SELECT
+  t.page_id,
+  COALESCE(json_extract(t.titles, '$[0]'), '(mangler titel)') AS title_main,
+  COALESCE(json_remove(t.titles, '$[0]'), '[]') AS extras_json,
+  CASE
+    WHEN t.nr = '' THEN NULL
+    WHEN lower(t.nr) LIKE 'nr%' THEN t.nr
+    ELSE trim('Nr. ' || ltrim(t.nr, ' .-'))
+  END AS display_nr,
+  NULLIF(t.scale, '') AS display_scale,
+  ltrim(
+    lower(replace(replace(replace(
+      COALESCE(json_extract(t.titles, '$[0]'), '(mangler titel)'),
+      'Æ', 'æ'), 'Ø', 'ø'), 'Å', 'å')),
+    ' "''«»„“”()[]-–.,:;'
+  ) AS sort_key
+FROM (
+  SELECT
+    x.page_id,
+    CASE WHEN json_array_length(x.titles_v2) > 0 THEN x.titles_v2 ELSE x.titles_v1 END AS titles,
+    x.nr,
+    x.scale
+  FROM (
+    SELECT
+      p.id AS page_id,
+      (SELECT json_group_array(trim(value))
+         FROM json_each(CASE WHEN json_type(p.left_titles_json_v2) = 'array' THEN p.left_titles_json_v2 ELSE '[]' END)
+        WHERE trim(value) <> '') AS titles_v2,
+      (SELECT json_group_array(trim(value))
+         FROM json_each(CASE WHEN json_type(p.left_titles_json) = 'array' THEN p.left_titles_json ELSE '[]' END)
+        WHERE trim(value) <> '') AS titles_v1,
+      trim(COALESCE(NULLIF(p.left_nr_v2, ''), p.left_nr, '')) AS nr,
+      trim(COALESCE(NULLIF(p.left_scale_v2, ''), p.left_scale, '')) AS scale
+    FROM pages p
+  ) x
+) t;
+
+CREATE TABLE IF NOT EXISTS page_labels (
+  page_id INTEGER PRIMARY KEY,
+  title_main TEXT NOT NULL,
+  extras_json TEXT NOT NULL DEFAULT '[]',
+  display_nr TEXT,
+  display_scale TEXT,
+  sort_key TEXT NOT NULL,
+  FOREIGN KEY(page_id) REFERENCES pages(id)
+);
+
+-- browse: ORDER BY sort_key, page_id med keyset (?after=<sort_key>,<page_id>)
+CREATE INDEX IF NOT EXISTS page_labels_sort ON page_labels(sort_key, page_id);
+
+CREATE TRIGGER IF NOT EXISTS page_labels_ai AFTER INSERT ON pages BEGIN
+  INSERT OR REPLACE INTO page_labels
+  SELECT * FROM page_labels_src WHERE page_id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS page_labels_au AFTER UPDATE OF
+  left_titles_json_v2, left_titles_json, left_nr_v2, left_nr, left_scale_v2, left_scale
+ON pages BEGIN
+  INSERT OR REPLACE INTO page_labels
+  SELECT * FROM page_labels_src WHERE page_id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS page_labels_ad AFTER DELETE ON pages BEGIN
+  DELETE FROM page_labels WHERE page_id = old.id;
+END;
+
+-- ---------- left_fts: søgning i venstre-labels ----------
+-- Én kolonne pr. felt, så søgningen kan rangeres med bm25() og kolonnevægte
+-- (se LEFT_FTS_WEIGHTS i app/web.py). rowid = pages.id.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS left_fts USING fts5(
+  titles,
+  nr,
+  scale,
+  category,
+  tokenize='unicode61 remove_diacritics 2',
+  prefix='2 3 4'
+);
+
+-- indhold til left_fts; kun sider der har mindst ét label
+CREATE VIEW IF NOT EXISTS left_fts_src AS
+SELECT
+  l.page_id,
+  p.document_id,
+  trim(
+    CASE WHEN l.title_main = '(mangler titel)' THEN '' ELSE l.title_main END
+    || ' ' ||
+    COALESCE((SELECT group_concat(value, ' ') FROM json_each(l.extras_json)), '')
+  ) AS titles,
+  COALESCE(l.display_nr, '') AS nr,
+  COALESCE(l.display_scale, '') AS scale,
+  trim(COALESCE(d.category, '') || ' ' || COALESCE(d.subcategory, '')) AS category
+FROM page_labels l
+JOIN pages p ON p.id = l.page_id
+JOIN documents d ON d.id = p.document_id
+WHERE l.title_main <> '(mangler titel)'
+   OR l.display_nr IS NOT NULL
+   OR l.display_scale IS NOT NULL;
+
+-- trigram-indeks over samme label-tekst (titles + nr + scale), så delstrengs-
+-- søgning (fallback når left_fts giver få hits) ikke skal scanne hele pages.
+CREATE VIRTUAL TABLE IF NOT EXISTS left_trgm USING fts5(
+  label,
+  tokenize='trigram'
+);
+
+-- left_fts/left_trgm holdes opdateret af triggers, ligesom page_fts:
+-- pages -> page_labels (triggers ovenfor) -> left_fts/left_trgm.
+-- INSERT OR REPLACE i page_labels fyrer kun AFTER INSERT, derfor slettes først.
+
+CREATE TRIGGER IF NOT EXISTS left_fts_ai AFTER INSERT ON page_labels BEGIN
+  DELETE FROM left_fts WHERE rowid = new.page_id;
+  DELETE FROM left_trgm WHERE rowid = new.page_id;
+  INSERT INTO left_fts(rowid, titles, nr, scale, category)
+  SELECT page_id, titles, nr, scale, category FROM left_fts_src WHERE page_id = new.page_id;
+  INSERT INTO left_trgm(rowid, label)
+  SELECT page_id, trim(titles || ' ' || nr || ' ' || scale) FROM left_fts_src WHERE page_id = new.page_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS left_fts_au AFTER UPDATE ON page_labels BEGIN
+  DELETE FROM left_fts WHERE rowid = old.page_id;
+  DELETE FROM left_trgm WHERE rowid = old.page_id;
+  INSERT INTO left_fts(rowid, titles, nr, scale, category)
+  SELECT page_id, titles, nr, scale, category FROM left_fts_src WHERE page_id = new.page_id;
+  INSERT INTO left_trgm(rowid, label)
+  SELECT page_id, trim(titles || ' ' || nr || ' ' || scale) FROM left_fts_src WHERE page_id = new.page_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS left_fts_ad AFTER DELETE ON page_labels BEGIN
+  DELETE FROM left_fts WHERE rowid = old.page_id;
+  DELETE FROM left_trgm WHERE rowid = old.page_id;
+END;
+
+-- category-kolonnen i left_fts kommer fra documents
+CREATE TRIGGER IF NOT EXISTS left_fts_doc_au AFTER UPDATE OF category, subcategory ON documents BEGIN
+  DELETE FROM left_fts WHERE rowid IN (SELECT id FROM pages WHERE document_id = new.id);
+  INSERT INTO left_fts(rowid, titles, nr, scale, category)
+  SELECT page_id, titles, nr, scale, category FROM left_fts_src WHERE document_id = new.id;
+END;
+
+-- ---------- afledte billeder pr. side (scripts/derivatives.py) ----------
+-- kind: 'left' (venstre halvdel, OCR + LLM v1), 'llm' (upload-JPEG til LLM v2),
+-- 'thumb160'/'thumb320'/'thumb640' (WebP til /thumb).
+-- Filerne er indholdsadresserede og kan deles af flere sider. Thumbnails
+-- ligger i pakkefilen (path = 'pack', opslag via pack_blobs.sha256).
+
+CREATE TABLE IF NOT EXISTS page_derivatives (
+  page_id INTEGER NOT NULL,
+  kind TEXT NOT NULL,
+  path TEXT NOT NULL,
+  sha256 TEXT NOT NULL,
+  PRIMARY KEY(page_id, kind),
+  FOREIGN KEY(page_id) REFERENCES pages(id)
+);
+
+CREATE TRIGGER IF NOT EXISTS page_derivatives_ad AFTER DELETE ON pages BEGIN
+  DELETE FROM page_derivatives WHERE page_id = old.id;
+END;
+
+-- ---------- trin pr. side (scripts/pipeline.py) ----------
+-- En række pr. færdigt trin: 'rendered' (afledninger + thumbnails),
+-- 'labelled' (v2-labels fra LLM eller arvet), 'indexed' (left_fts/left_trgm).
+-- Trinnene skrives i samme transaktion som resultatet, så en afbrudt
+-- import fortsætter med de sider der mangler. fingerprint er et hash af
+-- trinnets input (se pipeline.py); NULL for sider fra før det blev gemt.
+
+CREATE TABLE IF NOT EXISTS page_stages (
+  page_id INTEGER NOT NULL,
+  stage TEXT NOT NULL,
+  done_at TEXT NOT NULL DEFAULT (datetime('now')),
+  fingerprint TEXT,
+  PRIMARY KEY(page_id, stage)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS page_stages_ad AFTER DELETE ON pages BEGIN
+  DELETE FROM page_stages WHERE page_id = old.id;
+END;
+
+-- ---------- thumbnail-pakke (scripts/thumb_pack.py) ----------
+-- Blobs ligger i data/packs/<pack> fra offset; rækker uden afledning ryddes af compact.
+
+CREATE TABLE IF NOT EXISTS pack_blobs (
+  sha256 TEXT PRIMARY KEY,
+  pack TEXT NOT NULL,
+  offset INTEGER NOT NULL,
+  length INTEGER NOT NULL
+);
+
+-- ---------- import-jobs (baggrundskø i app/web.py) ----------
+-- status: queued -> running -> done | error. heartbeat_at opdateres løbende,
+-- så en job der stod som running da processen døde, kan tages op igen.
+-- pdf_path er den endelige fil i data/pdfs (uploaden streames direkte dertil).
+
+CREATE TABLE IF NOT EXISTS import_jobs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  status TEXT NOT NULL DEFAULT 'queued',
+  pdf_path TEXT NOT NULL,
+  orig_name TEXT NOT NULL,
+  category TEXT,
+  sha256 TEXT,
+  document_id INTEGER,
+  stage TEXT,
+  progress_i INTEGER,
+  progress_n INTEGER,
+  message TEXT,
+  error TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  started_at TEXT,
+  heartbeat_at TEXT,
+  finished_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS import_jobs_status ON import_jobs(status, id);
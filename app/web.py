@@ -1,19 +1,70 @@
-import io
 import re
 import json
+import os
 import sqlite3
 import sys
-import subprocess
-import tempfile
+import threading
 import time
+import queue
 from pathlib import Path
+from urllib.parse import urlencode
 
-from flask import Flask, request, render_template_string, send_file, abort, Response, stream_with_context, redirect
+from flask import Flask, Request, request, render_template_string, send_file, abort, Response, stream_with_context, redirect, g
+
+# delte DB-hjælpere ligger i scripts/ (bruges også af ingest/LLM-scripts)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from archive_db import ensure_schema  # noqa: E402
+from page_pdf_cache import single_page_pdf  # noqa: E402
+from pdf_workers import Busy, PdfWorkers, TaskTimeout  # noqa: E402
+from derivatives import THUMB_WIDTHS, resolve as resolve_derivative  # noqa: E402
+from thumb_pack import PackReader, release_derived  # noqa: E402
+from pipeline import UploadPart, find_document_by_sha256, place_pdf, run_import, sweep_stale_parts  # noqa: E402
 
 DB_PATH = Path("app/app.db")
 THUMBS_DIR = Path("data/thumbs")
 
+BROWSE_PAGE_SIZE = 200
+
+# thumbnails: WebP-stige fra ingest (scripts/derivatives.py). thumb320's sha256
+# indgår i URL'en (?v=), så de kan caches som immutable.
+THUMB_VERSION_KIND = "thumb320"
+THUMB_VERSION_LEN = 12
+THUMB_FALLBACK_MAX_AGE = 3600
+
+# søgning: left_fts rangeres med bm25(), så de bedste hits kommer først
+# og kandidatmængden kan holdes lille
+SEARCH_LIMIT = 60
+SUBSTRING_FALLBACK_BELOW = 30
+# bm25-vægte pr. kolonne i left_fts: titles, nr, scale, category
+LEFT_FTS_WEIGHTS = (10.0, 6.0, 2.0, 1.0)
+
+# læse-forbindelser genbruges mellem requests (se ReadPool)
+READ_POOL_SIZE = 8
+READ_PRAGMAS = (
+    "PRAGMA mmap_size=268435456;",  # 256 MiB
+    "PRAGMA cache_size=-65536;",    # 64 MiB
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA query_only=ON;",
+)
+
+class ArchiveRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # PDF-uploads skrives af form-parseren direkte ind i data/pdfs og hashes undervejs
+        # (i stedet for Werkzeugs egen temp-fil, som ellers skulle kopieres derhen)
+        if self.path != "/import":
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        part = UploadPart()
+        g.setdefault("upload_parts", []).append(part)
+        return part
+
 app = Flask(__name__)
+app.request_class = ArchiveRequest
+
+# PyMuPDF-arbejde (enkeltside-PDF'er) kører i egne processer, så søgning
+# ikke venter på GIL'en mens en stor scanning udtrækkes
+PDF_POOL = PdfWorkers()
+THUMB_PACK = PackReader()
+PDF_BUSY_RETRY_AFTER = 2
 
 # ---------- samlinger + underkategorier (labels) ----------
 
@@ -149,7 +200,16 @@ HTML = """
   {% for h in hits %}
     <div class="hit">
       <div>
-        <img src="/thumb/{{h['thumb']}}" alt="thumb">
+        {# pladsholderen (LQIP) vises inline til det rigtige billede er hentet; højden reserverer pladsen #}
+        {% set ph %}{% if h['aspect'] %} height="{{ (320 * h['aspect'])|round|int }}"{% endif %}{% if h['lqip'] %} style="background:url({{h['lqip']}}) center/cover no-repeat"{% endif %}{% endset %}
+        {% if h['thumb_v'] %}
+          {% set base = '/thumb/' ~ h['page_id'] ~ '?v=' ~ h['thumb_v'] ~ '&w=' %}
+          <img src="{{base}}320" alt="thumb" width="320"{{ph}} loading="lazy" decoding="async"
+               srcset="{% for w in thumb_widths %}{{base}}{{w}} {{w}}w{% if not loop.last %}, {% endif %}{% endfor %}"
+               sizes="320px">
+        {% else %}
+          <img src="/thumb/{{h['thumb']}}" alt="thumb" width="320"{{ph}} loading="lazy" decoding="async">
+        {% endif %}
       </div>
       <div class="meta">
         <div class="title">
@@ -188,6 +248,12 @@ HTML = """
       </div>
     </div>
   {% endfor %}
+
+  {% if next_qs %}
+    <div class="actions" style="margin:18px 0;">
+      <a href="/?{{next_qs}}">Næste side →</a>
+    </div>
+  {% endif %}
 </body>
 </html>
 """
@@ -204,6 +270,8 @@ IMPORT_HTML = """
     button { padding: 10px 14px; font-size: 16px; margin-top: 12px; }
     .muted { color:#666; margin-top: 10px; }
     a { display:inline-block; margin-left: 12px; }
+    .jobs td { padding: 4px 10px 4px 0; font-size: 14px; }
+    .jobs a { margin-left: 0; }
   </style>
 </head>
 <body>
@@ -235,21 +303,150 @@ IMPORT_HTML = """
       </div>
       <div class="muted">
         OBS: PDF skal være i originalt format (2 sider pr. side).
-        Import kan tage nogle minutter, da siderne skal scannes.
+        Import kører i baggrunden og kan tage nogle minutter, da siderne skal scannes.
       </div>
     </form>
   </div>
+
+  {% if jobs %}
+    <h3>Seneste importer</h3>
+    <table class="jobs">
+      {% for j in jobs %}
+        <tr>
+          <td><a href="/jobs/{{j['id']}}">#{{j['id']}}</a></td>
+          <td>{{j['orig_name']}}</td>
+          <td>{{j['status']}}{% if j['status'] == 'running' and j['stage'] %} ({{j['stage']}}{% if j['progress_n'] %} {{j['progress_i']}}/{{j['progress_n']}}{% endif %}){% endif %}</td>
+          <td class="muted">{{j['created_at']}}</td>
+        </tr>
+      {% endfor %}
+    </table>
+  {% endif %}
+</body>
+</html>
+"""
+
+JOB_HTML = """
+<!doctype html>
+<html>
+<head>
+  <meta charset="utf-8"/>
+  <title>Import #{{job['id']}}</title>
+  <style>
+    body { font-family: Arial, sans-serif; margin: 24px; }
+    .status { font-size: 22px; font-weight: 800; margin-bottom: 10px; }
+    .small { color: #666; margin-bottom: 14px; }
+    .mono { font-family: ui-monospace,Menlo,Consolas,monospace; background: #f7f7f7; padding: 10px; border-radius: 8px; white-space: pre-wrap; display: none; }
+  </style>
+</head>
+<body>
+  <div class="small">Import #{{job['id']}}: {{job['orig_name']}}</div>
+  <div class="status" id="status">I kø…</div>
+  <div class="small" id="small">Du kan lukke siden; importen fortsætter i baggrunden.</div>
+  <div class="mono" id="log"></div>
+  <p id="links" style="display:none;"><a href="/">Gå tilbage til oversigten</a> · <a href="/import">Importér flere</a></p>
+<script>
+function setStatus(t){document.getElementById('status').textContent=t;}
+function setSmall(t){document.getElementById('small').textContent=t;}
+function setLog(t){var el=document.getElementById('log'); el.textContent=t||''; el.style.display=t?'block':'none';}
+function took(a,b){
+  if(!a||!b) return '';
+  var s=Math.round((Date.parse(b.replace(' ','T')+'Z')-Date.parse(a.replace(' ','T')+'Z'))/1000);
+  return Math.floor(s/60)+':'+String(s%60).padStart(2,'0');
+}
+var es=new EventSource('/jobs/{{job['id']}}/events');
+es.onmessage=function(e){
+  var j=JSON.parse(e.data);
+  var prog=j.n ? ' (side '+j.i+'/'+j.n+')' : '';
+  if(j.status==='queued') setStatus('I kø…');
+  else if(j.status==='running' && j.stage==='ingest') setStatus('Genererer billeder'+prog);
+  else if(j.status==='running' && j.stage==='index') setStatus('Opdaterer søgeindeks…');
+  else if(j.status==='running') setStatus('Scanner venstre labels'+prog);
+  else if(j.status==='done'){ setStatus('Importering er nu færdig ✅'); setSmall('Tid i alt: '+took(j.started_at,j.finished_at)); }
+  else if(j.status==='error'){ setStatus('Fejl'); setSmall(''); }
+  setLog(j.error ? 'ERROR: '+j.error : j.message);
+};
+es.addEventListener('end',function(){ es.close(); document.getElementById('links').style.display='block'; });
+</script>
 </body>
 </html>
 """
 
 # ---------- helpers ----------
 
+# skemaet bringes ajour én gang pr. proces (init_db), ikke pr. request
+_db_ready = False
+_init_lock = threading.Lock()
+
+def init_db():
+    global _db_ready
+    with _init_lock:
+        if _db_ready:
+            return
+        con = sqlite3.connect(DB_PATH)
+        try:
+            ensure_schema(con)
+            sweep_stale_parts()
+            _db_ready = True
+        finally:
+            con.close()
+
 def connect_db():
+    """Ny skrive-forbindelse (delete/import). Læsning går gennem read_db()."""
+    init_db()
     con = sqlite3.connect(DB_PATH)
     con.row_factory = sqlite3.Row
     return con
 
+class ReadPool:
+    """Pulje af læse-forbindelser med pragmas sat én gang pr. forbindelse.
+
+    Forbindelser lånes pr. request (read_db) og afleveres i teardown.
+    Er puljen tom oprettes en ny; overskydende lukkes ved aflevering.
+    """
+
+    def __init__(self, db_path, size: int):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        con = sqlite3.connect(self.db_path, check_same_thread=False)
+        con.row_factory = sqlite3.Row
+        for pragma in READ_PRAGMAS:
+            con.execute(pragma)
+        return con
+
+    def release(self, con):
+        if con.in_transaction:
+            con.rollback()
+        try:
+            self._idle.put_nowait(con)
+        except queue.Full:
+            con.close()
+
+_read_pool = ReadPool(DB_PATH, READ_POOL_SIZE)
+
+def read_db():
+    if "read_con" not in g:
+        init_db()
+        g.read_con = _read_pool.acquire()
+    return g.read_con
+
+@app.teardown_request
+def _discard_upload_parts(exc):
+    # en upload der er placeret (place_pdf) eller afvist, findes ikke længere under .part-navnet
+    for part in g.pop("upload_parts", []):
+        part.discard()
+
+@app.teardown_appcontext
+def _release_read_db(exc):
+    con = g.pop("read_con", None)
+    if con is not None:
+        _read_pool.release(con)
+
 def list_categories(con):
     rows = con.execute("""
         SELECT DISTINCT category
@@ -259,17 +456,6 @@ def list_categories(con):
     """).fetchall()
     return [r["category"] for r in rows]
 
-def has_column(con, table: str, col: str) -> bool:
-    try:
-        rows = con.execute(f"PRAGMA table_info({table});").fetchall()
-        return any((r[1] == col) for r in rows)  # r[1] = name
-    except Exception:
-        return False
-
-def project_root() -> Path:
-    # app/web.py -> app/ -> project root
-    return Path(__file__).resolve().parents[1]
-
 def normalize(s: str) -> str:
     s = (s or "").lower()
     s = re.sub(r"[^a-zæøå0-9\s]", " ", s)
@@ -300,31 +486,24 @@ def _parse_titles_json(s):
         pass
     return []
 
-def _label_from_row(r):
-    # v2 først
-    titles = _parse_titles_json(r["left_titles_json_v2"] if "left_titles_json_v2" in r.keys() else None)
-    nr = (r["left_nr_v2"] if "left_nr_v2" in r.keys() else None) or ""
-    scale = (r["left_scale_v2"] if "left_scale_v2" in r.keys() else None) or ""
-
-    # fallback v1
-    if not titles:
-        titles = _parse_titles_json(r["left_titles_json"] if "left_titles_json" in r.keys() else None)
-    if not nr and "left_nr" in r.keys():
-        nr = r["left_nr"] or ""
-    if not scale and "left_scale" in r.keys():
-        scale = r["left_scale"] or ""
-
-    titles = [t for t in titles if t]
-    if not titles:
-        titles = ["(mangler titel)"]
-        # Ensartet visning: tilføj "Nr." hvis LLM kun gemte tal/tekst uden prefix
-    if nr:
-        nr_clean = nr.strip()
-        if nr_clean and not re.match(r"(?i)^nr\.?\s*", nr_clean):
-            nr_clean = nr_clean.lstrip(" .-")  # undgå "Nr. .104"
-            nr = f"Nr. {nr_clean}"
-
-    return titles[0], titles[1:], (nr.strip() or None), (scale.strip() or None)
+def _hit_from_row(r):
+    # label-kolonnerne kommer færdigberegnede fra page_labels (se app/schema.sql)
+    return {
+        "page_id": r["page_id"],
+        "filename": r["filename"],
+        "page_no": r["page_no"],
+        "thumb": Path(r["thumb_path"]).name if r["thumb_path"] else "",
+        # WebP-stigen findes for sider renderet efter den blev indført (ellers PNG'en)
+        "thumb_v": r["thumb_sha"][:THUMB_VERSION_LEN] if r["thumb_sha"] else None,
+        "lqip": r["lqip"],
+        "aspect": r["aspect"],
+        "title_main": r["title_main"],
+        "title_extras": json.loads(r["extras_json"] or "[]"),
+        "nr": r["display_nr"],
+        "scale": r["display_scale"],
+        "category": r["category"],
+        "subcategory": r["subcategory"],
+    }
 
 def _safe_filename(s: str) -> str:
     s = (s or "").strip()
@@ -363,93 +542,136 @@ def _download_name_from_page_row(r):
     base = _safe_filename(t) if t else Path(r["filename"]).stem
     return f"{base}.pdf"
 
-def _make_single_page_pdf(pdf_path: str, page_no_1based: int) -> bytes:
-    import fitz  # PyMuPDF
-    doc = fitz.open(pdf_path)
-    idx = max(0, int(page_no_1based) - 1)
-    if idx >= doc.page_count:
-        doc.close()
-        raise ValueError("Ugyldigt sidetal")
-    out = fitz.open()
-    out.insert_pdf(doc, from_page=idx, to_page=idx)
-    data = out.tobytes()
-    out.close()
-    doc.close()
-    return data
-
 # ---------- queries ----------
 
-def left_fts_search(con, fts_q: str, limit: int = 200, has_subcategory: bool = False):
-    sub_sel = "d.subcategory AS subcategory," if has_subcategory else "NULL AS subcategory,"
+def _collection_filter(series: str, sub: str):
+    """WHERE-led + parametre for samling/underkategori (bruger documents_collection)."""
+    where = []
+    params = []
+    if series:
+        where.append("d.category = ?")
+        params.append(series)
+        if sub:
+            where.append("d.subcategory = ?")
+            params.append(sub)
+    return where, params
+
+def left_fts_search(con, fts_q: str, limit: int = SEARCH_LIMIT,
+                    series: str = "", sub: str = ""):
+    where, params = _collection_filter(series, sub)
+    filter_sql = "".join(f"\n      AND {w}" for w in where)
+    weights = ", ".join(str(w) for w in LEFT_FTS_WEIGHTS)
     sql = f"""
     SELECT
       p.id AS page_id,
       d.filename,
       d.category,
-      {sub_sel}
+      d.subcategory,
       p.page_no,
       p.thumb_path,
-      p.left_titles_json_v2,
-      p.left_titles_json,
-      p.left_nr_v2,
-      p.left_nr,
-      p.left_scale_v2,
-      p.left_scale
+      p.lqip,
+      p.aspect,
+      l.title_main,
+      l.extras_json,
+      l.display_nr,
+      l.display_scale,
+      tv.sha256 AS thumb_sha
     FROM left_fts
     JOIN pages p ON p.id = left_fts.rowid
+    JOIN page_labels l ON l.page_id = p.id
     JOIN documents d ON d.id = p.document_id
-    WHERE left_fts MATCH ?
+    LEFT JOIN page_derivatives tv ON tv.page_id = p.id AND tv.kind = '{THUMB_VERSION_KIND}'
+    WHERE left_fts MATCH ?{filter_sql}
+    ORDER BY bm25(left_fts, {weights})
     LIMIT ?;
     """
-    return con.execute(sql, (fts_q, limit)).fetchall()
+    return con.execute(sql, (fts_q, *params, limit)).fetchall()
 
-def left_substring_search(con, q: str, limit: int = 200, has_subcategory: bool = False):
+def left_substring_search(con, q: str, limit: int = SEARCH_LIMIT,
+                          series: str = "", sub: str = ""):
     qn = normalize(q)
     if not qn:
         return []
-    sub_sel = "d.subcategory AS subcategory," if has_subcategory else "NULL AS subcategory,"
+    where, params = _collection_filter(series, sub)
+    filter_sql = "".join(f"\n      AND {w}" for w in where)
+    if len(qn) >= 3:
+        # trigram-frase = delstreng; normalize() har fjernet alt andet end bogstaver/tal/mellemrum
+        match_sql, match_arg = "left_trgm MATCH ?", f'"{qn}"'
+    else:
+        # under 3 tegn kan trigram-indekset ikke bruges; scan label-teksten
+        match_sql, match_arg = "left_trgm.label LIKE ?", f"%{qn}%"
     sql = f"""
     SELECT
       p.id AS page_id,
       d.filename,
       d.category,
-      {sub_sel}
+      d.subcategory,
       p.page_no,
       p.thumb_path,
-      p.left_titles_json_v2,
-      p.left_titles_json,
-      p.left_nr_v2,
-      p.left_nr,
-      p.left_scale_v2,
-      p.left_scale
-    FROM pages p
+      p.lqip,
+      p.aspect,
+      l.title_main,
+      l.extras_json,
+      l.display_nr,
+      l.display_scale,
+      tv.sha256 AS thumb_sha
+    FROM left_trgm
+    JOIN pages p ON p.id = left_trgm.rowid
+    JOIN page_labels l ON l.page_id = p.id
     JOIN documents d ON d.id = p.document_id
-    WHERE COALESCE(p.left_search_text_v2,'') <> ''
-      AND instr(lower(p.left_search_text_v2), ?) > 0
+    LEFT JOIN page_derivatives tv ON tv.page_id = p.id AND tv.kind = '{THUMB_VERSION_KIND}'
+    WHERE {match_sql}{filter_sql}
     LIMIT ?;
     """
-    return con.execute(sql, (qn, limit)).fetchall()
+    return con.execute(sql, (match_arg, *params, limit)).fetchall()
+
+def browse_pages(con, after=None, limit: int = BROWSE_PAGE_SIZE,
+                 series: str = "", sub: str = ""):
+    """Keyset-pagineret browse sorteret på (sort_key, page_id) via page_labels_sort.
 
-def all_pages(con, limit: int = 5000, has_subcategory: bool = False):
-    sub_sel = "d.subcategory AS subcategory," if has_subcategory else "NULL AS subcategory,"
+    after er (sort_key, page_id) for sidste række på forrige side.
+    """
+    where, params = _collection_filter(series, sub)
+    if after:
+        # opdelt i >= / OR i stedet for row-value, så SQLite laver SEARCH i indekset
+        where.append("l.sort_key >= ? AND (l.sort_key > ? OR l.page_id > ?)")
+        params += [after[0], after[0], after[1]]
+
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
     return con.execute(f"""
         SELECT
           p.id AS page_id,
           d.filename,
           d.category,
-          {sub_sel}
+          d.subcategory,
           p.page_no,
           p.thumb_path,
-          p.left_titles_json_v2,
-          p.left_titles_json,
-          p.left_nr_v2,
-          p.left_nr,
-          p.left_scale_v2,
-          p.left_scale
-        FROM pages p
+          p.lqip,
+          p.aspect,
+          l.title_main,
+          l.extras_json,
+          l.display_nr,
+          l.display_scale,
+          l.sort_key,
+          tv.sha256 AS thumb_sha
+        FROM page_labels l
+        JOIN pages p ON p.id = l.page_id
         JOIN documents d ON d.id = p.document_id
+        LEFT JOIN page_derivatives tv ON tv.page_id = p.id AND tv.kind = '{THUMB_VERSION_KIND}'
+        {where_sql}
+        ORDER BY l.sort_key, l.page_id
         LIMIT ?;
-    """, (limit,)).fetchall()
+    """, (*params, limit)).fetchall()
+
+def parse_after(s: str):
+    # "?after=<sortkey>,<page_id>" – sortkey kan selv indeholde komma
+    if not s or "," not in s:
+        return None
+    key, _, pid = s.rpartition(",")
+    try:
+        return key, int(pid)
+    except ValueError:
+        return None
 
 # ---------- routes ----------
 
@@ -461,79 +683,39 @@ def index():
     hits = []
     note = None
 
-    con = connect_db()
-    has_subcategory = has_column(con, "documents", "subcategory")
+    con = read_db()
 
     suboptions = []
     if series_filter and series_filter in COLLECTIONS:
         suboptions = COLLECTIONS[series_filter]
 
-    # Browse-mode: q tom -> vis alle, men sorter alfabetisk efter titel
+    # Browse-mode: q tom -> vis alle sorteret alfabetisk efter titel, én side ad gangen
     if not q:
-        if series_filter:
-            if has_subcategory and sub_filter:
-                rows = con.execute("""
-                    SELECT
-                      p.id AS page_id,
-                      d.filename,
-                      d.category,
-                      d.subcategory AS subcategory,
-                      p.page_no,
-                      p.thumb_path,
-                      p.left_titles_json_v2,
-                      p.left_titles_json,
-                      p.left_nr_v2,
-                      p.left_nr,
-                      p.left_scale_v2,
-                      p.left_scale
-                    FROM pages p
-                    JOIN documents d ON d.id = p.document_id
-                    WHERE d.category = ?
-                      AND d.subcategory = ?
-                    LIMIT ?;
-                """, (series_filter, sub_filter, 5000)).fetchall()
-            else:
-                rows = con.execute(f"""
-                    SELECT
-                      p.id AS page_id,
-                      d.filename,
-                      d.category,
-                      {"d.subcategory AS subcategory," if has_subcategory else "NULL AS subcategory,"}
-                      p.page_no,
-                      p.thumb_path,
-                      p.left_titles_json_v2,
-                      p.left_titles_json,
-                      p.left_nr_v2,
-                      p.left_nr,
-                      p.left_scale_v2,
-                      p.left_scale
-                    FROM pages p
-                    JOIN documents d ON d.id = p.document_id
-                    WHERE d.category = ?
-                    LIMIT ?;
-                """, (series_filter, 5000)).fetchall()
-        else:
-            rows = all_pages(con, limit=5000, has_subcategory=has_subcategory)
+        after = parse_after(request.args.get("after") or "")
+        rows = browse_pages(
+            con,
+            after=after,
+            limit=BROWSE_PAGE_SIZE + 1,
+            series=series_filter,
+            sub=sub_filter,
+        )
 
-        for r in rows:
-            main, extras, nr, scale = _label_from_row(r)
-            hits.append({
-                "page_id": r["page_id"],
-                "filename": r["filename"],
-                "page_no": r["page_no"],
-                "thumb": Path(r["thumb_path"]).name,
-                "title_main": main,
-                "title_extras": extras,
-                "nr": nr,
-                "scale": scale,
-                "category": r["category"],
-                "subcategory": r["subcategory"],
-            })
-        con.close()
+        next_qs = None
+        if len(rows) > BROWSE_PAGE_SIZE:
+            rows = rows[:BROWSE_PAGE_SIZE]
+            last = rows[-1]
+            args = {}
+            if series_filter:
+                args["series"] = series_filter
+            if sub_filter:
+                args["sub"] = sub_filter
+            args["after"] = f"{last['sort_key']},{last['page_id']}"
+            next_qs = urlencode(args)
 
-        hits.sort(key=lambda h: (normalize(h["title_main"]), normalize(h["filename"]), int(h["page_no"])))
+        for r in rows:
+            hits.append(_hit_from_row(r))
 
-        note = f"Resultater: {len(hits)}"
+        note = f"Viser {len(hits)} sider" if hits else "Ingen resultater"
         return render_template_string(
             HTML,
             q=q,
@@ -541,6 +723,8 @@ def index():
             note=note,
             series=SERIES,
             suboptions=suboptions,
+            next_qs=next_qs,
+            thumb_widths=THUMB_WIDTHS,
         )
 
     # Search-mode: bevar relevans (FTS først, derefter substring)
@@ -550,57 +734,30 @@ def index():
     rows = []
     if fts_q:
         try:
-            rows = left_fts_search(con, fts_q, limit=200, has_subcategory=has_subcategory)
+            rows = left_fts_search(
+                con, fts_q,
+                series=series_filter, sub=sub_filter,
+            )
         except sqlite3.OperationalError:
             rows = []
 
     for r in rows:
         if r["page_id"] in seen:
             continue
-        if series_filter and r["category"] != series_filter:
-            continue
-        if sub_filter and has_subcategory and r["subcategory"] != sub_filter:
-            continue
         seen.add(r["page_id"])
-        main, extras, nr, scale = _label_from_row(r)
-        hits.append({
-            "page_id": r["page_id"],
-            "filename": r["filename"],
-            "page_no": r["page_no"],
-            "thumb": Path(r["thumb_path"]).name,
-            "title_main": main,
-            "title_extras": extras,
-            "nr": nr,
-            "scale": scale,
-            "category": r["category"],
-            "subcategory": r["subcategory"],
-        })
-
-    if len(hits) < 30:
-        rows2 = left_substring_search(con, q, limit=200, has_subcategory=has_subcategory)
+        hits.append(_hit_from_row(r))
+
+    if len(hits) < SUBSTRING_FALLBACK_BELOW:
+        rows2 = left_substring_search(
+            con, q,
+            series=series_filter, sub=sub_filter,
+        )
         for r in rows2:
             if r["page_id"] in seen:
                 continue
-            if series_filter and r["category"] != series_filter:
-                continue
-            if sub_filter and has_subcategory and r["subcategory"] != sub_filter:
-                continue
             seen.add(r["page_id"])
-            main, extras, nr, scale = _label_from_row(r)
-            hits.append({
-                "page_id": r["page_id"],
-                "filename": r["filename"],
-                "page_no": r["page_no"],
-                "thumb": Path(r["thumb_path"]).name,
-                "title_main": main,
-                "title_extras": extras,
-                "nr": nr,
-                "scale": scale,
-                "category": r["category"],
-                "subcategory": r["subcategory"],
-            })
-
-    con.close()
+            hits.append(_hit_from_row(r))
+
     note = f"Resultater: {len(hits)}" if hits else "Ingen resultater"
     return render_template_string(
         HTML,
@@ -609,6 +766,7 @@ def index():
         note=note,
         series=SERIES,
         suboptions=suboptions,
+        thumb_widths=THUMB_WIDTHS,
     )
 
 @app.route("/thumb/<path:fname>")
@@ -616,55 +774,117 @@ def thumb(fname):
     path = (THUMBS_DIR / Path(fname).name).resolve()
     if not path.exists():
         abort(404)
-    return send_file(str(path))
+    return send_file(str(path), max_age=THUMB_FALLBACK_MAX_AGE)
+
+@app.route("/thumb/<int:page_id>")
+def thumb_sized(page_id: int):
+    """WebP-thumbnail i den mindste bredde >= ?w= (default 320).
+
+    ETag er derivatets sha256. Med ?v= (præfiks af thumb320's sha256, som
+    templaten sætter) ændres URL'en når siden renderes igen, så svaret kan
+    caches som immutable. Pakkede thumbnails sendes som et slice af
+    pakkefilens mmap (ingen kopi, ingen stat pr. fil).
+    """
+    want = request.args.get("w", type=int) or 320
+    fits = [w for w in sorted(THUMB_WIDTHS) if w >= want]
+    kind = f"thumb{fits[0] if fits else max(THUMB_WIDTHS)}"
+
+    con = read_db()
+    rows = {r["kind"]: r for r in con.execute("""
+        SELECT pd.kind, pd.path, pd.sha256, b.pack, b.offset, b.length
+        FROM page_derivatives pd
+        LEFT JOIN pack_blobs b ON b.sha256 = pd.sha256
+        WHERE pd.page_id = ? AND pd.kind IN (?, ?)
+    """, (page_id, kind, THUMB_VERSION_KIND))}
+    d = rows.get(kind)
+    blob = THUMB_PACK.get(d["pack"], d["offset"], d["length"]) if d and d["pack"] else None
+    # løse filer fra før pakken (indtil scripts/thumb_pack.py migrate er kørt)
+    path = resolve_derivative(d["path"]) if d and blob is None else None
+    if blob is None and path is None:
+        # siden har ingen WebP-stige endnu (se scripts/build_thumb_ladder.py)
+        r = con.execute("SELECT thumb_path FROM pages WHERE id = ?", (page_id,)).fetchone()
+        if not r or not r["thumb_path"]:
+            abort(404)
+        return thumb(Path(r["thumb_path"]).name)
+
+    v = request.args.get("v")
+    version = rows.get(THUMB_VERSION_KIND)
+    immutable = bool(v and version and version["sha256"].startswith(v))
+    max_age = 31536000 if immutable else THUMB_FALLBACK_MAX_AGE
+    if blob is None:
+        resp = send_file(str(path), mimetype="image/webp", etag=d["sha256"], conditional=True, max_age=max_age)
+    else:
+        resp = Response([blob], mimetype="image/webp", direct_passthrough=True)
+        resp.content_length = len(blob)
+        resp.set_etag(d["sha256"])
+        resp.cache_control.public = True
+        resp.cache_control.max_age = max_age
+        resp.make_conditional(request)
+    resp.cache_control.immutable = immutable
+    return resp
+
+@app.errorhandler(Busy)
+def _pdf_pool_busy(e):
+    return Response(
+        "Serveren er optaget – prøv igen om et øjeblik.",
+        status=503,
+        headers={"Retry-After": str(PDF_BUSY_RETRY_AFTER)},
+        mimetype="text/plain",
+    )
+
+@app.errorhandler(TaskTimeout)
+def _pdf_task_timeout(e):
+    return Response(str(e), status=504, mimetype="text/plain")
 
 @app.route("/view/<int:page_id>")
 def view_page(page_id: int):
-    con = connect_db()
-    r = _get_page_info(con, page_id)
-    con.close()
+    r = _get_page_info(read_db(), page_id)
     if not r:
         abort(404)
 
     try:
-        pdf_bytes = _make_single_page_pdf(r["pdf_path"], r["page_no"])
+        pdf_file = single_page_pdf(r["pdf_path"], r["page_no"], run=PDF_POOL.run)
+    except (Busy, TaskTimeout):
+        raise
     except Exception as e:
         abort(500, description=str(e))
 
     fname = _download_name_from_page_row(r)
     return send_file(
-        io.BytesIO(pdf_bytes),
+        pdf_file,
         mimetype="application/pdf",
         as_attachment=False,
-        download_name=fname
+        download_name=fname,
+        conditional=True,
+        etag=pdf_file.stem,  # cache-nøglen; filens mtime ændres ved hvert LRU-hit
     )
 
 @app.route("/download/<int:page_id>")
 def download_page(page_id: int):
-    con = connect_db()
-    r = _get_page_info(con, page_id)
-    con.close()
+    r = _get_page_info(read_db(), page_id)
     if not r:
         abort(404)
 
     try:
-        pdf_bytes = _make_single_page_pdf(r["pdf_path"], r["page_no"])
+        pdf_file = single_page_pdf(r["pdf_path"], r["page_no"], run=PDF_POOL.run)
+    except (Busy, TaskTimeout):
+        raise
     except Exception as e:
         abort(500, description=str(e))
 
     fname = _download_name_from_page_row(r)
     return send_file(
-        io.BytesIO(pdf_bytes),
+        pdf_file,
         mimetype="application/pdf",
         as_attachment=True,
-        download_name=fname
+        download_name=fname,
+        conditional=True,
+        etag=pdf_file.stem,  # cache-nøglen; filens mtime ændres ved hvert LRU-hit
     )
 
 @app.route("/open/<int:page_id>")
 def open_page(page_id: int):
-    con = connect_db()
-    r = _get_page_info(con, page_id)
-    con.close()
+    r = _get_page_info(read_db(), page_id)
     if not r:
         abort(404)
 
@@ -699,13 +919,15 @@ def delete_page(page_id: int):
     thumb_name = Path(r["thumb_path"]).name if r["thumb_path"] else None
 
     try:
-        try:
-            con.execute("DELETE FROM left_fts WHERE rowid = ?", (page_id,))
-        except sqlite3.OperationalError:
-            pass
-
+        # page_derivatives-rækkerne slettes af en trigger; filerne kan deles med andre sider
+        derived = [row["path"] for row in con.execute(
+            "SELECT path FROM page_derivatives WHERE page_id = ?", (page_id,)
+        )]
+        # page_labels, left_fts og left_trgm ryddes af triggers
         con.execute("DELETE FROM pages WHERE id = ?", (page_id,))
         con.commit()
+        # under en import bliver filerne liggende til scripts/thumb_pack.py gc
+        release_derived(con, derived)
     finally:
         con.close()
 
@@ -719,15 +941,192 @@ def delete_page(page_id: int):
 
     return redirect("/")
 
-# ---------- import ----------
+# ---------- import (baggrundsjobs) ----------
+#
+# POST /import streamer PDF'en til data/pdfs og opretter en række i import_jobs.
+# IMPORT_WORKERS tråde i web-processen tager jobs fra tabellen og kører
+# pipeline.run_import (ingest, labels, indeks) i processen; fremskridt skrives i rækken og vises via SSE
+# (/jobs/<id>/events). Et job hvis heartbeat er ældre end JOB_STALE_AFTER
+# (fx fordi serveren blev genstartet midt i en import) tages op igen.
+
+IMPORT_WORKERS = 2
+JOB_STALE_AFTER = "-5 minutes"
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_SECONDS = 0.5
+JOB_DB_TIMEOUT = 60
+
+_job_wake = threading.Event()
+_workers_lock = threading.Lock()
+_workers = []
+
+def claim_job(con):
+    """Tag næste ventende (eller forladte) job. Atomisk, så flere tråde/processer kan dele køen."""
+    r = con.execute(f"""
+        UPDATE import_jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            started_at = COALESCE(started_at, CURRENT_TIMESTAMP),
+            heartbeat_at = CURRENT_TIMESTAMP
+        WHERE id = (
+            SELECT id FROM import_jobs
+            WHERE status = 'queued'
+               OR (status = 'running' AND heartbeat_at < datetime('now', '{JOB_STALE_AFTER}'))
+            ORDER BY id
+            LIMIT 1
+        )
+        RETURNING *
+    """).fetchone()
+    con.commit()
+    return r
+
+def update_job(con, job_id: int, **fields):
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    con.execute(
+        f"UPDATE import_jobs SET {sets}, heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (*fields.values(), job_id),
+    )
+    con.commit()
+
+class JobStatus:
+    """Jobbets felter i import_jobs, skrevet på en egen forbindelse (jobs_con).
+
+    Pipelinen batcher sine commits (render: COMMIT_EVERY sider), og en skrivning
+    på en anden forbindelse i samme tråd ville vente på pipelinens egen skrivelås.
+    Felterne samles derfor og skrives først når pipelinen ikke har en åben
+    transaktion; pipelinens transaktion røres aldrig herfra.
+    """
+
+    def __init__(self, jobs_con, pipeline_con, job_id: int):
+        self.jobs_con = jobs_con
+        self.pipeline_con = pipeline_con
+        self.job_id = job_id
+        self.pending = {}
+
+    def update(self, **fields):
+        self.pending.update(fields)
+        if self.pipeline_con.in_transaction:
+            return
+        try:
+            update_job(self.jobs_con, self.job_id, **self.pending)
+        except sqlite3.OperationalError:
+            self.jobs_con.rollback()  # kun visning; prøves igen ved næste event
+            return
+        self.pending.clear()
+
+    def finish(self, **fields):
+        update_job(self.jobs_con, self.job_id, **{**self.pending, **fields})
+        self.pending.clear()
+
+def run_import_job(con, jobs_con, job):
+    job_id = job["id"]
+    document_id = job["document_id"]
+    status = JobStatus(jobs_con, con, job_id)
+
+    # et genoptaget job fortsætter med samme dokument; page_stages afgør hvilke
+    # sider der mangler (afbrudt før document_id blev gemt: ingest finder det via sha256)
+    if document_id is not None and not con.execute(
+        "SELECT 1 FROM documents WHERE id = ?", (document_id,)
+    ).fetchone():
+        document_id = None
+    if document_id is None:
+        status.update(stage="ingest", progress_i=None, progress_n=None)
+
+    errors = []
+    message = None
+    stage = None
+    events = run_import(
+        con, Path(job["pdf_path"]), job["category"],
+        document_id=document_id, sha256=job["sha256"],
+    )
+    for ev in events:
+        if ev["stage"] != stage:
+            stage = ev["stage"]
+            status.update(stage=stage, progress_i=None, progress_n=None)
+        if ev["event"] in ("document", "duplicate"):
+            status.update(document_id=ev["document_id"])
+        elif "i" in ev:
+            status.update(progress_i=ev["i"], progress_n=ev["n"])
+        if ev["event"] == "duplicate":
+            message = duplicate_message(ev["document_id"], ev["filename"], job["category"])
+            discard_upload(con, Path(job["pdf_path"]))
+        if ev.get("status") == "error":
+            errors.append(f"page_id={ev['page_id']} ERROR: {ev['error']}")
+
+    # left_fts er allerede opdateret: triggers kører ved hver label-commit
+    con.commit()
+    status.finish(
+        status="done", stage="done",
+        message="\n".join(errors[-20:]) or message,
+        finished_at=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+    )
+
+def discard_upload(con, pdf_path: Path):
+    # jobbets egen upload (samme indhold importeret samtidigt af et andet job);
+    # en fil som et dokument peger på, slettes aldrig
+    if not con.execute("SELECT 1 FROM documents WHERE path = ?", (str(pdf_path),)).fetchone():
+        pdf_path.unlink(missing_ok=True)
+
+def duplicate_message(document_id: int, filename: str, category: str | None) -> str:
+    msg = f"PDF'en findes allerede i arkivet som dokument #{document_id} ({filename}); intet er importeret igen."
+    if category:
+        msg += f" Kategorien er sat til '{category}'."
+    return msg
+
+def import_worker():
+    init_db()
+    # et andet jobs ingest holder skrivelåsen mellem sine commits; vent hellere end at fejle
+    con = sqlite3.connect(DB_PATH, timeout=JOB_DB_TIMEOUT)
+    con.row_factory = sqlite3.Row
+    # import_jobs skrives på sin egen forbindelse (se JobStatus)
+    jobs_con = sqlite3.connect(DB_PATH, timeout=JOB_DB_TIMEOUT)
+    jobs_con.row_factory = sqlite3.Row
+    while True:
+        try:
+            job = claim_job(jobs_con)
+        except sqlite3.OperationalError:
+            job = None  # fx database is locked; prøv igen ved næste poll
+        if job is None:
+            _job_wake.wait(timeout=5)
+            _job_wake.clear()
+            continue
+
+        try:
+            if job["attempts"] > JOB_MAX_ATTEMPTS:
+                raise RuntimeError(f"opgivet efter {JOB_MAX_ATTEMPTS} forsøg")
+            run_import_job(con, jobs_con, job)
+        except Exception as e:
+            con.rollback()
+            jobs_con.rollback()
+            update_job(
+                jobs_con, job["id"],
+                status="error", error=str(e),
+                finished_at=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            )
+
+def start_import_workers():
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(IMPORT_WORKERS):
+            t = threading.Thread(target=import_worker, name=f"import-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+def recent_jobs(con, limit: int = 10):
+    return con.execute("""
+        SELECT id, status, orig_name, stage, progress_i, progress_n, created_at
+        FROM import_jobs
+        ORDER BY id DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
 
 @app.route("/import", methods=["GET", "POST"])
 def import_pdf():
     if request.method == "GET":
-        con = connect_db()
-        cats = list_categories(con)
-        con.close()
-        return render_template_string(IMPORT_HTML, categories=cats)
+        con = read_db()
+        return render_template_string(
+            IMPORT_HTML, categories=list_categories(con), jobs=recent_jobs(con)
+        )
 
     f = request.files.get("pdf")
     if not f or not f.filename:
@@ -742,142 +1141,111 @@ def import_pdf():
     if not orig_name.lower().endswith(".pdf"):
         orig_name += ".pdf"
 
-    tmp_dir = Path(tempfile.gettempdir())
-    tmp_path = tmp_dir / orig_name
+    # form-parseren har skrevet uploaden direkte ind i data/pdfs og hashet den
+    # undervejs (ArchiveRequest); en kendt PDF afvises før den får et navn
+    part = f.stream
+    part.flush()
+    tmp, sha = part.path, part.hexdigest()
 
-    i = 2
-    while tmp_path.exists():
-        tmp_path = tmp_dir / f"{Path(orig_name).stem}_{i}.pdf"
-        i += 1
+    con = connect_db()
+    try:
+        dup = find_document_by_sha256(con, sha)
+        if dup is not None:
+            tmp.unlink()
+            if chosen_cat:
+                con.execute("UPDATE documents SET category = ? WHERE id = ?", (chosen_cat, dup["id"]))
+            cur = con.execute("""
+                INSERT INTO import_jobs(pdf_path, orig_name, category, sha256, document_id,
+                                        status, stage, message, started_at, finished_at)
+                VALUES (?, ?, ?, ?, ?, 'done', 'done', ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            """, (dup["path"], orig_name, chosen_cat, sha, dup["id"],
+                  duplicate_message(dup["id"], dup["filename"], chosen_cat)))
+            con.commit()
+            return redirect(f"/jobs/{cur.lastrowid}", code=303)
 
-    f.save(str(tmp_path))
+        pdf_path = place_pdf(tmp, orig_name)
+        cur = con.execute(
+            "INSERT INTO import_jobs(pdf_path, orig_name, category, sha256) VALUES (?, ?, ?, ?)",
+            (str(pdf_path), orig_name, chosen_cat, sha),
+        )
+        con.commit()
+        job_id = cur.lastrowid
+    finally:
+        con.close()
 
-    root = project_root()
-    py = sys.executable
+    _job_wake.set()
+    return redirect(f"/jobs/{job_id}", code=303)
+
+def _job_event(r) -> dict:
+    return {
+        "id": r["id"],
+        "status": r["status"],
+        "stage": r["stage"],
+        "i": r["progress_i"],
+        "n": r["progress_n"],
+        "document_id": r["document_id"],
+        "message": r["message"],
+        "error": r["error"],
+        "created_at": r["created_at"],
+        "started_at": r["started_at"],
+        "finished_at": r["finished_at"],
+    }
 
-    def run_cmd(cmd):
-        p = subprocess.Popen(
-            cmd,
-            cwd=str(root),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-        )
-        try:
-            for line in p.stdout:
-                yield line.rstrip("\n")
-        finally:
-            p.wait()
-        if p.returncode != 0:
-            raise RuntimeError(f"Command failed ({p.returncode}): {' '.join(cmd)}")
+@app.route("/jobs/<int:job_id>")
+def job_page(job_id: int):
+    r = read_db().execute("SELECT id, orig_name FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
+    if not r:
+        abort(404)
+    return render_template_string(JOB_HTML, job=r)
+
+@app.route("/jobs/<int:job_id>/events")
+def job_events(job_id: int):
+    """Server-Sent Events: én 'data:'-linje (JSON) hver gang jobbet ændrer sig."""
+    con = read_db()
+    if not con.execute("SELECT 1 FROM import_jobs WHERE id = ?", (job_id,)).fetchone():
+        abort(404)
 
     @stream_with_context
     def stream():
-        start_ts = time.time()
-
-        yield """<!doctype html><html><head><meta charset="utf-8"/>
-<title>Import i gang…</title>
-<style>
-body{font-family:Arial,sans-serif;margin:24px;}
-.status{font-size:22px;font-weight:800;margin-bottom:10px;}
-.small{color:#666;margin-bottom:14px;}
-.mono{font-family:ui-monospace,Menlo,Consolas,monospace;background:#f7f7f7;padding:10px;border-radius:8px;white-space:pre-wrap;display:none;}
-</style>
-</head><body>
-<div class="status" id="status">Importering igang</div>
-<div class="small" id="small">Vent venligst… Dette kan tage nogle minutter.</div>
-<div class="mono" id="log"></div>
-<script>
-function setStatus(t){document.getElementById('status').textContent=t;}
-function setSmall(t){document.getElementById('small').textContent=t;}
-function addLog(t){document.getElementById('log').textContent += t + "\\n";}
-</script>
-"""
-
-        document_id = None
-
-        try:
-            ingest_cmd = [py, "scripts/ingest_pdf.py", str(tmp_path)]
-            for line in run_cmd(ingest_cmd):
-                if line.startswith("DOCUMENT_ID="):
-                    document_id = int(line.split("=", 1)[1].strip())
-                    continue
-
-                if line.startswith("THUMB "):
-                    prog = line.split(" ", 1)[1].strip()  # fx "1/65"
-                    yield f"<script>setStatus('Genererer billeder (side {prog})');</script>\n"
-                    continue
-
-                # ellers: ignorer rå log-linjer
-
-            if document_id is None:
-                yield "<script>setStatus('Fejl'); addLog('ERROR: ingest gav ingen DOCUMENT_ID – stopper.');</script>\n"
-                yield "<p><a href='/import'>Tilbage</a></p>\n"
-                yield "</body></html>"
+        yield "retry: 2000\n\n"
+        last = None
+        idle = 0.0
+        while True:
+            r = con.execute("SELECT * FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
+            ev = _job_event(r)
+            if ev != last:
+                yield f"data: {json.dumps(ev, ensure_ascii=False)}\n\n"
+                last = ev
+                idle = 0.0
+            if ev["status"] in ("done", "error"):
+                yield "event: end\ndata: {}\n\n"
                 return
+            time.sleep(JOB_POLL_SECONDS)
+            idle += JOB_POLL_SECONDS
+            if idle >= 15:
+                yield ": ping\n\n"  # hold forbindelsen åben gennem proxies
+                idle = 0.0
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-            # gem kategori på dokumentet (efter ingest har oprettet documents-row)
-            if chosen_cat:
-                try:
-                    con2 = connect_db()
-                    con2.execute("UPDATE documents SET category = ? WHERE id = ?", (chosen_cat, document_id))
-                    con2.commit()
-                    con2.close()
-                except sqlite3.OperationalError as e:
-                    raise RuntimeError('DB mangler kolonnen documents.category. Kør: sqlite3 app/app.db "ALTER TABLE documents ADD COLUMN category TEXT;"') from e
-
-            con = connect_db()
-            con.execute("""
-                UPDATE pages
-                SET left_source_v2 = NULL
-                WHERE document_id = ?
-                  AND left_source_v2 LIKE 'llm_error_v2:%'
-            """, (document_id,))
-            con.commit()
-            con.close()
-
-            yield "<script>setStatus('Scanner venstre labels…');</script>\n"
-            llm_cmd = [py, "scripts/llm_left_labels_v2.py", "--document-id", str(document_id)]
-            for line in run_cmd(llm_cmd):
-                m = re.match(r"^\[(\d+)/(\d+)\]\s+page_id=", line)
-                if m:
-                    i, n = m.group(1), m.group(2)
-                    yield f"<script>setStatus('Scanner venstre labels (side {i}/{n})');</script>\n"
-                    continue
-
-                if "ERROR" in line or "Traceback" in line:
-                    safe = line.replace("\\", "\\\\").replace("'", "\\'")
-                    yield f"<script>addLog('{safe}');</script>\n"
-
-            yield "<script>setStatus('Opdaterer arkiv…');</script>\n"
-            fts_cmd = [py, "scripts/update_left_fts_for_document.py", str(document_id)]
-            for _ in run_cmd(fts_cmd):
-                pass
-
-            elapsed = int(time.time() - start_ts)
-            mm = elapsed // 60
-            ss = elapsed % 60
-            took = f"{mm}:{ss:02d}"
-
-            yield "<script>setStatus('Importering er nu færdig ✅');</script>\n"
-            yield f"<script>setSmall('Tid i alt: {took}');</script>\n"
-            yield "<p><a href='/'>Gå tilbage til oversigten</a></p>\n"
-
-        except Exception as e:
-            msg = str(e).replace("\\", "\\\\").replace("'", "\\'")
-            yield f"<script>setStatus('Fejl'); addLog('ERROR: {msg}');</script>\n"
-            yield "<p><a href='/import'>Tilbage</a></p>\n"
-
-        finally:
-            try:
-                tmp_path.unlink(missing_ok=True)
-            except Exception:
-                pass
-
-        yield "</body></html>"
+def create_app():
+    """WSGI-indgang (fx gunicorn 'web:create_app()'): skema og import-workers startes
+    i serverprocessen, så køede og afbrudte jobs genoptages uden at vente på en request.
 
-    return Response(stream(), mimetype="text/html")
+    Ikke ved import: spawn-børnene (PdfWorkers, render_all) importerer modulet igen.
+    """
+    init_db()
+    start_import_workers()
+    return app
 
 if __name__ == "__main__":
+    # debug-reloaderen kører også scriptet i overvågningsprocessen; kun serverprocessen (WERKZEUG_RUN_MAIN) starter workers
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        create_app()
+    else:
+        init_db()
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
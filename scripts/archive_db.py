@@ -0,0 +1,214 @@
+import hashlib
+import sqlite3
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / "app" / "app.db"
+SCHEMA_PATH = ROOT / "app" / "schema.sql"
+
+# Kolonner der er kommet til efter den første schema.sql.
+# Ældre DB'er får dem via ALTER TABLE, før schema.sql køres (triggers/views bruger dem).
+LATE_COLUMNS = {
+    "documents": {
+        "title": "TEXT",
+        "model_no": "TEXT",
+        "category": "TEXT",
+        "subcategory": "TEXT",
+        "sha256": "TEXT",
+    },
+    "pages": {
+        "key_text": "TEXT",
+        "left_titles_json": "TEXT",
+        "left_nr": "TEXT",
+        "left_scale": "TEXT",
+        "left_confidence": "REAL",
+        "left_source": "TEXT",
+        "left_titles_json_v2": "TEXT",
+        "left_nr_v2": "TEXT",
+        "left_scale_v2": "TEXT",
+        "left_confidence_v2": "REAL",
+        "left_source_v2": "TEXT",
+        "left_search_text_v2": "TEXT",
+        "phash": "TEXT",
+        "lqip": "TEXT",
+        "aspect": "REAL",
+    },
+    "import_jobs": {
+        "sha256": "TEXT",
+    },
+    "page_stages": {
+        "fingerprint": "TEXT",
+    },
+}
+
+
+def connect(db_path: Path = DB_PATH):
+    con = sqlite3.connect(db_path)
+    con.row_factory = sqlite3.Row
+    return con
+
+
+def ensure_columns(con: sqlite3.Connection):
+    for table, wanted in LATE_COLUMNS.items():
+        existing = {r[1] for r in con.execute(f"PRAGMA table_info({table});").fetchall()}
+        if not existing:
+            continue  # tabellen oprettes af schema.sql med alle kolonner
+        for col, typ in wanted.items():
+            if col not in existing:
+                con.execute(f"ALTER TABLE {table} ADD COLUMN {col} {typ};")
+    con.commit()
+
+
+def _left_fts_needs_rebuild(con: sqlite3.Connection) -> bool:
+    """True hvis left_fts/left_trgm mangler eller left_fts har det gamle layout (så den droppes her)."""
+    cols = {r[1] for r in con.execute("PRAGMA table_info(left_fts);").fetchall()}
+    if "left_search_text" in cols:
+        # før kolonnevægtning var left_fts én kolonne (left_search_text)
+        con.execute("DROP TABLE left_fts;")
+        con.commit()
+        return True
+    if not cols:
+        return True
+    return not con.execute("PRAGMA table_info(left_trgm);").fetchall()
+
+
+def ensure_schema(con: sqlite3.Connection):
+    """Bring DB op til app/schema.sql (idempotent) og udfyld manglende page_labels."""
+    ensure_columns(con)
+    rebuild_fts = _left_fts_needs_rebuild(con)
+    new_ledger = not con.execute("PRAGMA table_info(page_stages);").fetchall()
+    new_sha_index = not con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'documents_sha256'"
+    ).fetchone()
+    con.executescript(SCHEMA_PATH.read_text(encoding="utf-8"))
+    con.execute("""
+        INSERT INTO page_labels
+        SELECT * FROM page_labels_src
+        WHERE page_id NOT IN (SELECT page_id FROM page_labels)
+    """)
+    if rebuild_fts:
+        reindex_left_fts(con)
+    con.commit()
+    if new_ledger:
+        backfill_page_stages(con)
+    if new_sha_index:
+        # én gang ved migreringen; senere: python scripts/arkiv.py hash-documents
+        backfill_document_sha256(con)
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def backfill_document_sha256(con: sqlite3.Connection) -> int:
+    """Hash PDF'er importeret før documents.sha256 fandtes. Returnerer antal hashede.
+
+    Ligger samme fil i arkivet flere gange, får kun den første hashen
+    (unik index); de andre forbliver NULL.
+    """
+    rows = con.execute("SELECT id, path FROM documents WHERE sha256 IS NULL").fetchall()
+    n = 0
+    for doc_id, path in rows:
+        p = Path(path)
+        if not p.is_absolute():
+            p = ROOT / p
+        if not p.exists():
+            continue
+        sha = file_sha256(p)
+        if con.execute("SELECT 1 FROM documents WHERE sha256 = ?", (sha,)).fetchone():
+            continue
+        con.execute("UPDATE documents SET sha256 = ? WHERE id = ?", (sha, doc_id))
+        con.commit()
+        n += 1
+    return n
+
+
+def mark_stage(con: sqlite3.Connection, stage: str, page_ids, fingerprint: str | None = None) -> None:
+    """Notér i page_stages at trinnet er færdigt for siderne. Commit er kalderens."""
+    con.executemany(
+        "INSERT OR REPLACE INTO page_stages(page_id, stage, fingerprint) VALUES(?, ?, ?)",
+        [(pid, stage, fingerprint) for pid in page_ids],
+    )
+
+
+def backfill_page_stages(con: sqlite3.Connection):
+    """Udled trinene for sider fra før page_stages (køres én gang, når tabellen oprettes)."""
+    con.execute("""
+        INSERT OR IGNORE INTO page_stages(page_id, stage)
+        SELECT id, 'rendered' FROM pages p
+        WHERE thumb_path IS NOT NULL
+           OR EXISTS (SELECT 1 FROM page_derivatives pd WHERE pd.page_id = p.id AND pd.kind = 'llm')
+    """)
+    con.execute("""
+        INSERT OR IGNORE INTO page_stages(page_id, stage)
+        SELECT id, 'labelled' FROM pages
+        WHERE left_source_v2 IS NOT NULL AND left_source_v2 NOT LIKE 'llm_error_v2:%'
+    """)
+    con.execute("""
+        INSERT OR IGNORE INTO page_stages(page_id, stage)
+        SELECT rowid, 'indexed' FROM left_fts
+    """)
+    con.commit()
+
+
+def refresh_page_labels(con: sqlite3.Connection, page_ids=None) -> int:
+    """Genberegn page_labels for de givne sider (None = alle). Returnerer antal rækker."""
+    if page_ids is None:
+        con.execute("DELETE FROM page_labels WHERE page_id NOT IN (SELECT id FROM pages)")
+        cur = con.execute("INSERT OR REPLACE INTO page_labels SELECT * FROM page_labels_src")
+        return cur.rowcount
+    n = 0
+    for pid in page_ids:
+        cur = con.execute(
+            "INSERT OR REPLACE INTO page_labels SELECT * FROM page_labels_src WHERE page_id = ?",
+            (pid,),
+        )
+        n += cur.rowcount
+    return n
+
+
+_LEFT_TRGM_LABEL = "trim(titles || ' ' || nr || ' ' || scale)"
+# tælles op når left_fts/left_trgm eller left_fts_src ændres i schema.sql
+# (indgår i 'indexed'-fingerprintet, så arkiv.py rebuild genindekserer)
+FTS_VERSION = 1
+
+
+def reindex_left_fts(con: sqlite3.Connection, document_id: int | None = None) -> int:
+    """Genopbyg left_fts og left_trgm fra left_fts_src (hele indekset eller ét dokument).
+
+    Til daglig holder triggers i schema.sql indekserne opdateret; dette er til
+    migrering og reparation. Returnerer antal indekserede sider.
+    """
+    if document_id is None:
+        con.execute("DELETE FROM left_fts;")
+        con.execute("DELETE FROM left_trgm;")
+        cur = con.execute("""
+            INSERT INTO left_fts(rowid, titles, nr, scale, category)
+            SELECT page_id, titles, nr, scale, category FROM left_fts_src
+        """)
+        con.execute(f"""
+            INSERT INTO left_trgm(rowid, label)
+            SELECT page_id, {_LEFT_TRGM_LABEL} FROM left_fts_src
+        """)
+        return cur.rowcount
+
+    for table in ("left_fts", "left_trgm"):
+        con.execute(
+            f"DELETE FROM {table} WHERE rowid IN (SELECT id FROM pages WHERE document_id = ?)",
+            (document_id,),
+        )
+    cur = con.execute("""
+        INSERT INTO left_fts(rowid, titles, nr, scale, category)
+        SELECT page_id, titles, nr, scale, category FROM left_fts_src
+        WHERE document_id = ?
+    """, (document_id,))
+    con.execute(f"""
+        INSERT INTO left_trgm(rowid, label)
+        SELECT page_id, {_LEFT_TRGM_LABEL} FROM left_fts_src
+        WHERE document_id = ?
+    """, (document_id,))
+    return cur.rowcount
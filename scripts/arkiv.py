@@ -0,0 +1,137 @@
+"""Vedligehold af hele arkivet.
+
+    python scripts/arkiv.py rebuild [--stage rendered|labelled|indexed] [--document-id N]
+                                    [--dry-run] [--include-unknown] [--workers N] [--concurrency N]
+                                    [--ocr-threshold X]
+    python scripts/arkiv.py hash-documents
+
+rebuild går trinnene igennem i rækkefølge (rendered -> labelled -> indexed)
+og laver kun de sider om, hvis fingerprint i page_stages ikke passer med de
+nuværende indstillinger (DPI, JPEG-regler, model, prompt, FTS; se
+pipeline.py). Forældede sider mister trinnet og køres gennem de almindelige
+pipeline-trin: rendering i processer, labels med samtidige LLM-kald på
+tværs af dokumenter. Da labels afhænger af llm-billedets hash, bliver de
+først forældede når en ny rendering faktisk ændrer billedet.
+
+Sider fra før fingerprints blev gemt, regnes som aktuelle; --include-unknown
+laver også dem om. Sider der aldrig har fået et trin (fx fejlede LLM-kald),
+klares af de almindelige scripts (llm_left_labels_v2.py m.fl.).
+
+hash-documents giver dokumenter uden documents.sha256 (importeret før
+kolonnen fandtes, eller hvis PDF'en manglede ved migreringen) en hash, så
+dublet-tjekket ved import også kender dem.
+"""
+import argparse
+import os
+import sqlite3
+from pathlib import Path
+
+from archive_db import backfill_document_sha256, ensure_schema
+from pipeline import enrich, index, render, stale_pages
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / "app" / "app.db"
+STAGES = ("rendered", "labelled", "indexed")
+
+
+def connect_db():
+    con = sqlite3.connect(DB_PATH, timeout=60)
+    con.row_factory = sqlite3.Row
+    return con
+
+
+def invalidate(con, stage: str, page_ids):
+    con.executemany(
+        "DELETE FROM page_stages WHERE page_id = ? AND stage = ?",
+        [(pid, stage) for pid in page_ids],
+    )
+    con.commit()
+
+
+def rebuild(con, stages, document_id=None, include_unknown=False, dry_run=False,
+            workers=None, concurrency=None, ocr_threshold=None):
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        stale = stale_pages(con, stage, document_id, include_unknown)
+        n_docs = len({doc for _, doc in stale})
+        print(f"{stage}: {len(stale)} stale pages in {n_docs} documents", flush=True)
+        if dry_run:
+            continue
+
+        if stage == "labelled":
+            page_ids = [pid for pid, _ in stale]
+            invalidate(con, stage, page_ids)
+            if page_ids:
+                for ev in enrich(con, document_id, concurrency, page_ids=page_ids,
+                                 ocr_threshold=ocr_threshold):
+                    if ev["event"] == "page" and ev["status"] == "error":
+                        print(f"  page_id={ev['page_id']} ERROR: {ev['error']}", flush=True)
+                    elif ev["event"] == "done":
+                        print(f"  ok={ev['ok']} reused={ev['reused']} errors={ev['errors']} "
+                              f"missing={ev['missing']} ocr={ev['ocr']} escalated={ev['escalated']} "
+                              f"llm_calls={ev['stats']['calls']} "
+                              f"elapsed={ev['elapsed']:.1f}s", flush=True)
+            continue
+
+        # render/index pr. dokument; trinnet tager selv de sider der mangler det
+        by_doc = {}
+        for pid, doc in stale:
+            by_doc.setdefault(doc, []).append(pid)
+        for doc, page_ids in sorted(by_doc.items()):
+            if stage == "rendered":
+                pdf_path = con.execute("SELECT path FROM documents WHERE id = ?", (doc,)).fetchone()[0]
+                if not Path(pdf_path).exists():
+                    # behold de gamle afledninger hellere end at efterlade siderne uden
+                    print(f"  document_id={doc} SKIPPED: PDF not found: {pdf_path}", flush=True)
+                    continue
+            invalidate(con, stage, page_ids)
+            try:
+                if stage == "rendered":
+                    last = None
+                    for last in render(con, doc, workers):
+                        pass
+                    if last:
+                        print(f"  document_id={doc} rendered {last['i']}/{last['n']}", flush=True)
+                else:
+                    # nyt FTS-layout: rækkerne skal faktisk genopbygges
+                    for ev in index(con, doc, force=True):
+                        print(f"  document_id={doc} indexed={ev['inserted']}", flush=True)
+            except Exception as e:
+                con.rollback()
+                print(f"  document_id={doc} ERROR: {type(e).__name__}: {e}", flush=True)
+
+    if dry_run:
+        print("(dry run: a re-render can make more pages stale in the later stages)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("rebuild", help="lav forældede sider om (alle dokumenter)")
+    p.add_argument("--stage", choices=STAGES, action="append",
+                   help="kun disse trin (kan gentages; default alle)")
+    p.add_argument("--document-id", type=int, default=None)
+    p.add_argument("--dry-run", action="store_true", help="vis kun antal forældede sider")
+    p.add_argument("--include-unknown", action="store_true",
+                   help="lav også sider uden gemt fingerprint om")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                   help="render-processer (default: alle kerner)")
+    p.add_argument("--concurrency", type=int, default=None, help="samtidige LLM-kald")
+    p.add_argument("--ocr-threshold", type=float, default=None,
+                   help="labels: OCR først, LLM kun under tærsklen")
+    sub.add_parser("hash-documents", help="hash PDF'er der mangler documents.sha256")
+    args = parser.parse_args()
+
+    con = connect_db()
+    ensure_schema(con)
+    if args.cmd == "hash-documents":
+        print(f"Hashed: {backfill_document_sha256(con)} documents")
+    else:
+        rebuild(con, args.stage or STAGES, args.document_id, args.include_unknown, args.dry_run,
+                args.workers, args.concurrency, args.ocr_threshold)
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,144 @@
+"""OCR af venstre halvdel til pages.key_text for alle dokumenter.
+
+    python scripts/build_key_text.py [--document-id N] [--all] [--workers N]
+
+Billedet er 'left'-afledningen fra ingest; mangler den, renderes siden i
+hukommelsen med fitz (intet skrives til disk). OCR'en kører i en pulje af
+processer, der lever hele kørslen (én tesseract-API pr. proces med
+tesserocr, se ocr_labels.image_to_text), og kun hovedprocessen skriver
+key_text, i transaktioner af COMMIT_EVERY sider.
+
+Uden --all tages kun sider uden key_text.
+"""
+import argparse
+import multiprocessing
+import os
 import sqlite3
-import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+
 from PIL import Image
 
-DB_PATH = Path("app/app.db")
-PDF_PATH = Path("data/processed/+ Modeludvalg  gamle 98 - 160.pdf")
-TMP_DIR = Path("data/tmp_key")
-TMP_DIR.mkdir(parents=True, exist_ok=True)
-
-def render_page(pdf_path: Path, page_no: int, out_png: Path):
-    # render hele siden
-    prefix = out_png.with_suffix("")
-    cmd = [
-        "pdftoppm", "-png", "-r", "200",
-        "-f", str(page_no), "-l", str(page_no),
-        "-singlefile",
-        str(pdf_path), str(prefix)
-    ]
-    subprocess.run(cmd, check=True)
-
-def ocr_image(img_path: Path) -> str:
-    # OCR på dansk + engelsk (dansk hjælper på æøå)
-    cmd = ["tesseract", str(img_path), "stdout", "-l", "dan+eng", "--psm", "6"]
-    res = subprocess.run(cmd, check=True, capture_output=True, text=True)
-    text = " ".join(res.stdout.split())
-    return text.strip()
+from archive_db import ensure_schema
 
-def main():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / "app" / "app.db"
+CHUNK_PAGES = 8
+COMMIT_EVERY = 50
+
+# ---------- OCR (kører i worker-processer) ----------
+
+_worker_pdf = None  # (path, fitz-dokument) for det senest brugte dokument
+
+
+def _left_image(pdf_path: str, page_no: int, left_path: str | None) -> Image.Image:
+    global _worker_pdf
+    from derivatives import RENDER_DPI, pixmap_to_image, resolve
+
+    src = resolve(left_path)
+    if src is not None:
+        with Image.open(src) as img:
+            img.load()
+            return img
 
-    # hent pages for doc_id=1 (tilpas senere når du har flere docs)
-    rows = con.execute("""
-        SELECT id, page_no, document_id
-        FROM pages
-        WHERE document_id = 1
-        ORDER BY page_no
-    """).fetchall()
+    import fitz  # PyMuPDF
 
-    for r in rows:
-        pid = r["id"]
-        page_no = r["page_no"]
+    if _worker_pdf is None or _worker_pdf[0] != pdf_path:
+        if _worker_pdf is not None:
+            _worker_pdf[1].close()
+        _worker_pdf = (pdf_path, fitz.open(pdf_path))
+    pix = _worker_pdf[1].load_page(page_no - 1).get_pixmap(dpi=RENDER_DPI, alpha=False)
+    img = pixmap_to_image(pix)
+    return img.crop((0, 0, img.width // 2, img.height))
 
-        full_png = TMP_DIR / f"p{page_no}_full.png"
-        render_page(PDF_PATH, page_no, full_png)
 
-        img = Image.open(full_png)
-        w, h = img.size
+def ocr_pages(items: list[tuple]) -> list[tuple[int, str | None, str | None]]:
+    """[(page_id, pdf_path, page_no, left_path)] -> [(page_id, key_text, fejl)]."""
+    from ocr_labels import image_to_text
 
-        # crop: venstre halvdel + kun top 35% (overskrift område)
-        crop = img.crop((0, 0, int(w*0.5), h))
-        crop_png = TMP_DIR / f"p{page_no}_lefttop.png"
-        crop.save(crop_png)
+    out = []
+    for page_id, pdf_path, page_no, left_path in items:
+        try:
+            text = image_to_text(_left_image(pdf_path, page_no, left_path))
+            out.append((page_id, " ".join(text.split()), None))
+        except Exception as e:
+            out.append((page_id, None, f"{type(e).__name__}: {e}"))
+    return out
 
-        key_text = ocr_image(crop_png)
 
-        con.execute("UPDATE pages SET key_text=? WHERE id=?", (key_text, pid))
+def ocr_all(items: list[tuple], workers: int):
+    """Yield (page_id, key_text, fejl) efterhånden som siderne bliver færdige."""
+    # sider fra samme dokument i samme opgave, så hver worker sjældent skifter PDF
+    chunks = [items[i:i + CHUNK_PAGES] for i in range(0, len(items), CHUNK_PAGES)]
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from ocr_pages(chunk)
+        return
 
-        if page_no % 10 == 0:
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        futures = [pool.submit(ocr_pages, chunk) for chunk in chunks]
+        for fut in as_completed(futures):
+            yield from fut.result()
+
+
+def connect_db():
+    con = sqlite3.connect(DB_PATH, timeout=60)
+    con.row_factory = sqlite3.Row
+    return con
+
+
+def main():
+    from ocr_labels import engine
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--document-id", type=int, default=None)
+    parser.add_argument("--all", action="store_true", help="lav også key_text om for sider der har den")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="OCR-processer (default: alle kerner)")
+    args = parser.parse_args()
+
+    con = connect_db()
+    ensure_schema(con)
+
+    sql = """
+        SELECT p.id, d.path AS pdf_path, p.page_no, pd.path AS left_path
+        FROM pages p
+        JOIN documents d ON d.id = p.document_id
+        LEFT JOIN page_derivatives pd ON pd.page_id = p.id AND pd.kind = 'left'
+        WHERE 1 = 1
+    """
+    params = []
+    if not args.all:
+        sql += " AND COALESCE(p.key_text, '') = ''"
+    if args.document_id is not None:
+        sql += " AND p.document_id = ?"
+        params.append(args.document_id)
+    rows = con.execute(sql + " ORDER BY p.document_id, p.page_no", params).fetchall()
+    print(f"Pages to OCR: {len(rows)} (engine={engine()}, workers={args.workers})")
+
+    done = errors = 0
+    batch = []
+    for page_id, key_text, error in ocr_all([tuple(r) for r in rows], args.workers):
+        done += 1
+        if error:
+            errors += 1
+            print(f"page_id={page_id} ERROR: {error}", flush=True)
+            continue
+        batch.append((key_text, page_id))
+        if len(batch) >= COMMIT_EVERY:
+            con.executemany("UPDATE pages SET key_text = ? WHERE id = ?", batch)
             con.commit()
-            print(f"{page_no}/{rows[-1]['page_no']}")
+            batch.clear()
+            print(f"{done}/{len(rows)}", flush=True)
 
+    con.executemany("UPDATE pages SET key_text = ? WHERE id = ?", batch)
     con.commit()
     con.close()
-    print("Done build_key_text")
+    print(f"Done build_key_text: {done - errors} pages, {errors} errors")
+
 
 if __name__ == "__main__":
     main()
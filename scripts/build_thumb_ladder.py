@@ -0,0 +1,83 @@
+"""Lav WebP-thumbnails (thumb160/320/640) og LQIP-pladsholder for sider importeret før ingest lavede dem.
+
+    python scripts/build_thumb_ladder.py [--document-id N]
+
+Kilden er den eksisterende PNG-thumbnail i data/thumbs; PDF'en åbnes ikke.
+WebP-stigen skrives i pakkefilen (se thumb_pack.py).
+"""
+import argparse
+import sqlite3
+from pathlib import Path
+
+from PIL import Image
+
+from archive_db import ensure_schema
+from derivatives import THUMB_WIDTHS, lqip, thumb_ladder
+from thumb_pack import register as register_blobs, writing as pack_writing
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / "app" / "app.db"
+THUMBS_DIR = ROOT / "data" / "thumbs"
+COMMIT_EVERY = 50
+
+def connect_db():
+    con = sqlite3.connect(DB_PATH)
+    con.row_factory = sqlite3.Row
+    return con
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--document-id", type=int, default=None)
+    args = parser.parse_args()
+
+    con = connect_db()
+    ensure_schema(con)
+
+    sql = """
+        SELECT p.id, p.thumb_path, p.lqip IS NULL AS need_lqip,
+               NOT EXISTS (
+                 SELECT 1 FROM page_derivatives pd
+                 WHERE pd.page_id = p.id AND pd.kind = ?
+               ) AS need_ladder
+        FROM pages p
+        WHERE p.thumb_path IS NOT NULL
+    """
+    params = [f"thumb{min(THUMB_WIDTHS)}"]
+    if args.document_id is not None:
+        sql += " AND p.document_id = ?"
+        params.append(args.document_id)
+    rows = con.execute(
+        f"SELECT * FROM ({sql}) WHERE need_lqip OR need_ladder ORDER BY id", params
+    ).fetchall()
+    print(f"Pages missing thumb ladder or placeholder: {len(rows)}")
+
+    # writing(): compact venter til blobs fra denne kørsel er committet
+    with pack_writing():
+        done = missing = 0
+        for r in rows:
+            src = THUMBS_DIR / Path(r["thumb_path"]).name
+            if not src.exists():
+                missing += 1
+                continue
+            with Image.open(src) as img:
+                if r["need_ladder"]:
+                    ladder, blobs = thumb_ladder(img)
+                    register_blobs(con, blobs)
+                    con.executemany(
+                        "INSERT OR REPLACE INTO page_derivatives(page_id, kind, path, sha256) VALUES(?, ?, ?, ?)",
+                        [(r["id"], kind, path, sha) for kind, (path, sha) in ladder.items()],
+                    )
+                if r["need_lqip"]:
+                    placeholder, aspect = lqip(img)
+                    con.execute("UPDATE pages SET lqip = ?, aspect = ? WHERE id = ?", (placeholder, aspect, r["id"]))
+            done += 1
+            if done % COMMIT_EVERY == 0:
+                con.commit()
+                print(f"{done}/{len(rows)}", flush=True)
+
+        con.commit()
+    con.close()
+    print(f"Done: {done} pages, {missing} without thumbnail file")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from pathlib import Path
 from PIL import Image, ImageOps
 import pytesseract
 
+from derivatives import resolve as resolve_derivative
+
 ROOT = Path(__file__).resolve().parents[1]
 DB_PATH = ROOT / "app" / "app.db"
 
@@ -20,12 +22,20 @@ def ensure_columns(con):
         con.execute("ALTER TABLE documents ADD COLUMN model_no TEXT;")
     con.commit()
 
-def extract_model_no_from_thumb(thumb_path):
-    im = Image.open(thumb_path).convert("L")
+# nr-feltet nederst til højre på venstre side, som andel af hele opslaget
+NR_BOX = (0.43, 0.74, 0.50, 0.92)
+
+def extract_model_no(img_path, left_half=False):
+    # left_half: 'left'-afledningen (200 dpi), ellers den gamle PNG-thumbnail af hele opslaget
+    im = Image.open(img_path).convert("L")
     im = ImageOps.autocontrast(im)
     w, h = im.size
-    r = im.crop((int(w*0.43), int(h*0.74), int(w*0.50), int(h*0.92)))
-    r = r.resize((r.size[0]*6, r.size[1]*6))
+    x0, y0, x1, y1 = NR_BOX
+    if left_half:
+        x0, x1 = x0 * 2, x1 * 2
+    r = im.crop((int(w*x0), int(h*y0), int(w*x1), int(h*y1)))
+    zoom = 4 if left_half else 6
+    r = r.resize((r.size[0]*zoom, r.size[1]*zoom))
     t = pytesseract.image_to_string(r, lang="dan+eng", config="--psm 6")
     nums = re.findall(r"\d{2,4}", t)
     return nums[0] if nums else None
@@ -72,9 +82,10 @@ def main():
     ensure_columns(con)
 
     rows = con.execute("""
-        SELECT d.id, d.filename, p.thumb_path, p.key_text
+        SELECT d.id, d.filename, p.thumb_path, p.key_text, pd.path AS left_path
         FROM documents d
         JOIN pages p ON p.document_id = d.id
+        LEFT JOIN page_derivatives pd ON pd.page_id = p.id AND pd.kind = 'left'
         WHERE p.page_no = (
             SELECT MIN(p2.page_no) FROM pages p2 WHERE p2.document_id = d.id
         )
@@ -84,12 +95,19 @@ def main():
     for r in rows:
         title = extract_title_from_key_text(r["key_text"])
 
+        left = resolve_derivative(r["left_path"])
         thumb = resolve_thumb(r["thumb_path"])
-        model_no = extract_model_no_from_thumb(thumb) if thumb and thumb.exists() else None
+        if left:
+            model_no = extract_model_no(left, left_half=True)
+        elif thumb and thumb.exists():
+            model_no = extract_model_no(thumb)
+        else:
+            model_no = None
 
         if title or model_no:
+            # et felt der ikke kunne læses denne gang, overskriver ikke et tidligere fund
             con.execute(
-                "UPDATE documents SET title=?, model_no=? WHERE id=?",
+                "UPDATE documents SET title=COALESCE(?, title), model_no=COALESCE(?, model_no) WHERE id=?",
                 (title, model_no, r["id"])
             )
             updated += 1
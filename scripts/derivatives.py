@@ -0,0 +1,186 @@
+"""Afledte billeder pr. side, lavet i ét render-pas ved ingest.
+
+Siden rasteriseres én gang i RENDER_DPI, og herfra laves:
+  left   - venstre halvdel i RENDER_DPI som PNG (OCR og llm_left_labels.py)
+  llm    - JPEG af venstre halvdel klar til upload i llm_left_labels_v2.py
+           (max LLM_MAX_WIDTH bred, gråtone når siden ikke har farve)
+  thumbW - WebP i bredderne THUMB_WIDTHS (thumb160/thumb320/thumb640) til /thumb,
+           skaleret fra en mellemstørrelse i THUMB_DPI og gemt i pakkefilen (thumb_pack.py)
+  phash  - dHash af venstre halvdel (pages.phash, se phash.py)
+  lqip   - lille WebP som data-URI + højde/bredde (pages.lqip/aspect), pladsholder i HTML
+
+left/llm gemmes indholdsadresseret i data/derived/<sha[:2]>/<sha>.<ext> og
+registreres i page_derivatives, så senere trin læser filen i stedet for at
+åbne PDF'en eller dekode thumbnailen igen.
+"""
+import base64
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from PIL import Image
+
+from phash import HASH_SIZE, dhash
+from thumb_pack import PACK_PATH, append as pack_append
+
+ROOT = Path(__file__).resolve().parents[1]
+DERIVED_DIR = ROOT / "data" / "derived"
+
+RENDER_DPI = 200
+THUMB_DPI = 140
+LLM_MAX_WIDTH = 700  # venstre halvdel; samme opløsning som da hele opslaget var 1400 bredt
+LLM_QUALITY = (35, 70)  # JPEG-kvalitet: højeste der holder sig under MAX_UPLOAD_BYTES
+GRAY_SATURATION = 80  # pixels mere mættede end dette (0-255) regnes som farve
+GRAY_MAX_COLOR = 0.01  # andel farvede pixels under hvilken siden sendes i gråtone
+THUMB_WIDTHS = (640, 320, 160)  # største først; hver skaleres fra den forrige
+THUMB_WEBP_QUALITY = 72
+LQIP_WIDTH = 16
+LQIP_QUALITY = 40
+MAX_UPLOAD_BYTES = 900_000
+# tælles op når render_page/encode_llm_jpeg ændres uden at konstanterne ovenfor gør
+RENDER_VERSION = 2
+
+
+def render_settings() -> dict:
+    """Alt der bestemmer render_page's output; indgår i 'rendered'-fingerprintet (pipeline.py)."""
+    return {
+        "version": RENDER_VERSION,
+        "render_dpi": RENDER_DPI,
+        "thumb_dpi": THUMB_DPI,
+        "thumb_widths": THUMB_WIDTHS,
+        "thumb_webp_quality": THUMB_WEBP_QUALITY,
+        "lqip": [LQIP_WIDTH, LQIP_QUALITY],
+        "llm_max_width": LLM_MAX_WIDTH,
+        "llm_quality": LLM_QUALITY,
+        "gray": [GRAY_SATURATION, GRAY_MAX_COLOR],
+        "max_upload_bytes": MAX_UPLOAD_BYTES,
+        "phash_size": HASH_SIZE,
+    }
+
+
+def pixmap_to_image(pix) -> Image.Image:
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def is_colored(img: Image.Image) -> bool:
+    # gulnet papir er svagt mættet; farvet tegning/tekst er stærkt mættet
+    sat = img.convert("HSV").getchannel("S").histogram()
+    return sum(sat[GRAY_SATURATION:]) > GRAY_MAX_COLOR * sum(sat)
+
+
+def prepare_llm_image(img: Image.Image) -> Image.Image:
+    """Venstre halvdel af opslaget (prompten bruger kun den), nedskaleret og evt. i gråtone."""
+    img = img.convert("RGB")
+    img = img.crop((0, 0, img.width // 2, img.height))
+    if img.width > LLM_MAX_WIDTH:
+        ratio = LLM_MAX_WIDTH / img.width
+        img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.LANCZOS)
+    return img if is_colored(img) else img.convert("L")
+
+
+def _jpeg(img: Image.Image, quality: int, optimize: bool = False) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=optimize)
+    return buf.getvalue()
+
+
+def encode_llm_jpeg(img: Image.Image) -> bytes:
+    """JPEG under MAX_UPLOAD_BYTES med den højeste kvalitet i LLM_QUALITY.
+
+    Passer den højeste kvalitet (det normale), koster det én kodning.
+    Ellers bisektion uden optimize: optimize gør kun filen mindre, så den
+    fundne kvalitet holder også i den endelige kodning.
+    """
+    img = prepare_llm_image(img)
+    lo, hi = LLM_QUALITY
+    data = _jpeg(img, hi, optimize=True)
+    if len(data) <= MAX_UPLOAD_BYTES:
+        return data
+    # højeste kvalitet i [lo, hi) der passer; lo bruges selv om den ikke gør
+    while lo < hi - 1:
+        mid = (lo + hi) // 2
+        if len(_jpeg(img, mid)) <= MAX_UPLOAD_BYTES:
+            lo = mid
+        else:
+            hi = mid
+    return _jpeg(img, lo, optimize=True)
+
+
+def thumb_ladder(img: Image.Image) -> tuple[dict, list]:
+    """WebP-thumbnails i THUMB_WIDTHS, skrevet i pakkefilen.
+
+    Returnerer ({f"thumb{w}": (PACK_PATH, sha256)}, blobs); blobs
+    ([(sha256, pack, offset, length)]) registreres af kalderen med thumb_pack.register.
+    """
+    out, blobs = {}, []
+    cur = img.convert("RGB")
+    for w in THUMB_WIDTHS:
+        if cur.width > w:
+            cur = cur.resize((w, round(cur.height * w / cur.width)), Image.LANCZOS)
+        buf = io.BytesIO()
+        cur.save(buf, format="WEBP", quality=THUMB_WEBP_QUALITY, method=4)
+        data = buf.getvalue()
+        sha = hashlib.sha256(data).hexdigest()
+        out[f"thumb{w}"] = (PACK_PATH, sha)
+        blobs.append((sha, *pack_append(data)))
+    return out, blobs
+
+
+def lqip(img: Image.Image) -> tuple[str, float]:
+    """Mini-pladsholder (~150 bytes) som data-URI, og sidens højde/bredde-forhold."""
+    aspect = img.height / img.width
+    tiny = img.convert("RGB").resize((LQIP_WIDTH, max(1, round(LQIP_WIDTH * aspect))), Image.BOX)
+    buf = io.BytesIO()
+    tiny.save(buf, format="WEBP", quality=LQIP_QUALITY)
+    return "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode("ascii"), aspect
+
+
+def store(data: bytes, ext: str) -> tuple[str, str]:
+    """Gem bytes indholdsadresseret. Returnerer (relativ sti, sha256)."""
+    sha = hashlib.sha256(data).hexdigest()
+    p = DERIVED_DIR / sha[:2] / f"{sha}.{ext}"
+    if not p.exists():
+        p.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, p)
+    return p.relative_to(ROOT).as_posix(), sha
+
+
+def render_page(page) -> tuple[dict, dict]:
+    """Rasterisér en fitz-side én gang og lav alle afledte billeder.
+
+    Returnerer ({kind: (rel_path, sha256)}, meta): de indholdsadresserede
+    afledninger og kolonnerne til pages (phash, lqip, aspect) samt
+    meta["blobs"] til pack_blobs.
+    """
+    pix = page.get_pixmap(dpi=RENDER_DPI, alpha=False)
+    img = pixmap_to_image(pix)
+    del pix
+
+    scale = THUMB_DPI / RENDER_DPI
+    thumb = img.resize((round(img.width * scale), round(img.height * scale)), Image.LANCZOS)
+
+    left = img.crop((0, 0, img.width // 2, img.height))
+    buf = io.BytesIO()
+    left.save(buf, format="PNG", compress_level=1)  # intern fil; hastighed > størrelse
+
+    ladder, blobs = thumb_ladder(thumb)
+    derived = {
+        "left": store(buf.getvalue(), "png"),
+        "llm": store(encode_llm_jpeg(img), "jpg"),
+        **ladder,
+    }
+    placeholder, aspect = lqip(thumb)
+    return derived, {"phash": dhash(left), "lqip": placeholder, "aspect": aspect, "blobs": blobs}
+
+
+def resolve(rel_path: str | None) -> Path | None:
+    """Løs fil for en afledning; None for pakkede blobs (læses med thumb_pack.PackReader)."""
+    if not rel_path or rel_path == PACK_PATH:
+        return None
+    p = ROOT / rel_path
+    return p if p.exists() else None
@@ -0,0 +1,73 @@
+"""Disk-cache-mappe med størrelsesloft; mtime bruges som LRU-tidsstempel.
+
+Fælles for llm_cache.py og page_pdf_cache.py: filerne skrives atomisk
+(write_atomic), læsere kalder touch() ved hit, og added() holder styr på
+den samlede størrelse og sletter de ældste filer når loftet overskrides.
+"""
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+
+def write_atomic(p: Path, data: bytes):
+    """Skriv via en midlertidig fil i samme mappe, så en læser aldrig ser en halv fil."""
+    p.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, p)
+
+
+class DiskLRU:
+    def __init__(self, cache_dir: Path, pattern: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.pattern = pattern  # fx "*/*.json"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # samlet størrelse, beregnes ved første added()
+
+    def touch(self, p: Path) -> bool:
+        """Markér p som senest brugt. False hvis filen ikke findes."""
+        try:
+            os.utime(p)
+            return True
+        except OSError:
+            return False
+
+    def added(self, size: int, keep: Path | None = None):
+        """Notér en ny fil på size bytes; ryd op til 90 % af loftet hvis det overskrides."""
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._size = self._evict(self.max_bytes * 9 // 10, keep)
+
+    def _entries(self):
+        for p in self.cache_dir.glob(self.pattern):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            yield p, st.st_mtime, st.st_size
+
+    def _scan_size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _evict(self, target: int, keep: Path | None = None) -> int:
+        """Slet de mindst nyligt brugte filer til cachen er under target. Returnerer ny størrelse."""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for p, _, size in entries:
+            if total <= target:
+                break
+            if p == keep:
+                continue
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+        return total
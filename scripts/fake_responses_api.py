@@ -0,0 +1,106 @@
+"""Lokal stub af OpenAI Responses API til test af LLM-scripts uden netværk.
+
+    python scripts/fake_responses_api.py --port 8765 --latency 1.5 --error-rate 0.1
+
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test \\
+        python scripts/llm_left_labels_v2.py --document-id 3 --concurrency 8
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ARGS = None
+_counter = 0
+_counter_lock = threading.Lock()
+
+
+def next_id() -> int:
+    global _counter
+    with _counter_lock:
+        _counter += 1
+        return _counter
+
+
+def fake_label(n: int) -> dict:
+    return {
+        "titles": [f"Testmodel {n} - ved Stub Server", "Forstykke"],
+        "nr": f"Nr. {100 + n}",
+        "scale": "1:2",
+        "confidence": 0.9,
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        if not ARGS.quiet:
+            super().log_message(fmt, *args)
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        req = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/responses"):
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        time.sleep(max(0.0, random.gauss(ARGS.latency, ARGS.latency / 4)))
+
+        if random.random() < ARGS.error_rate:
+            status = random.choice([429, 500, 503])
+            self._send(status, {"error": {"message": "stub error", "type": "stub", "code": str(status)}})
+            return
+
+        n = next_id()
+        text = json.dumps(fake_label(n), ensure_ascii=False)
+        self._send(200, {
+            "id": f"resp_stub_{n}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": req.get("model", "stub"),
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_stub_{n}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "usage": {
+                "input_tokens": ARGS.tokens - 40,
+                "output_tokens": 40,
+                "total_tokens": ARGS.tokens,
+            },
+        })
+
+
+def main():
+    global ARGS
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="gennemsnitlig svartid i sekunder")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="andel af kald der svarer 429/5xx")
+    parser.add_argument("--tokens", type=int, default=1200, help="total_tokens pr. svar")
+    parser.add_argument("--quiet", action="store_true")
+    ARGS = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", ARGS.port), Handler)
+    print(f"Fake Responses API on http://127.0.0.1:{ARGS.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
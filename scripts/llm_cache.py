@@ -0,0 +1,57 @@
+"""Indholdsadresseret disk-cache for LLM-svar (parset JSON).
+
+Nøglen er sha256(billede + prompt + model), så samme billede med samme prompt
+og model aldrig sendes igen, mens en ændret prompt kun rammer de kald den
+faktisk indgår i. Filerne ligger i data/llm_cache/<2 tegn>/<sha>.json; mtime
+bruges som LRU-tidsstempel og de ældste slettes når cachen bliver for stor.
+
+LLM_CACHE=0 slår cachen fra; LLM_CACHE_MAX_MB sætter loftet (default 200).
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from disk_lru import DiskLRU, write_atomic
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT / "data" / "llm_cache"
+MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024
+ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+_lru = DiskLRU(CACHE_DIR, "*/*.json", MAX_BYTES)
+
+
+def cache_key(image: bytes, prompt: str, model: str) -> str:
+    h = hashlib.sha256()
+    for part in (image, prompt.encode("utf-8"), model.encode("utf-8")):
+        # længdepræfiks så grænserne mellem delene ikke kan flyde sammen
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def _path(key: str) -> Path:
+    return CACHE_DIR / key[:2] / f"{key}.json"
+
+
+def get(key: str):
+    if not ENABLED:
+        return None
+    p = _path(key)
+    try:
+        data = json.loads(p.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    _lru.touch(p)
+    return data
+
+
+def put(key: str, value: dict):
+    if not ENABLED:
+        return
+    p = _path(key)
+    body = json.dumps(value, ensure_ascii=False).encode("utf-8")
+    # atomisk skrivning, så en afbrudt kørsel ikke efterlader halve filer
+    write_atomic(p, body)
+    _lru.added(len(body))
@@ -7,6 +7,10 @@ from pathlib import Path
 import fitz  # PyMuPDF
 from openai import OpenAI
 
+import llm_cache
+from archive_db import ensure_schema
+from derivatives import resolve
+
 ROOT = Path(__file__).resolve().parents[1]
 DB_PATH = ROOT / "app" / "app.db"
 
@@ -47,6 +51,11 @@ def render_left_half_png(pdf_path: str, page_no_1based: int, zoom: float = 2.0)
         doc.close()
 
 def llm_extract(image_png_bytes: bytes) -> dict:
+    key = llm_cache.cache_key(image_png_bytes, PROMPT, MODEL)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+
     b64 = base64.b64encode(image_png_bytes).decode("utf-8")
     resp = client.responses.create(
         model=MODEL,
@@ -59,22 +68,9 @@ def llm_extract(image_png_bytes: bytes) -> dict:
         }],
         text={"format": {"type": "json_object"}},
     )
-    return json.loads(resp.output_text)
-
-def ensure_columns(con: sqlite3.Connection):
-    # Tilføj kolonner hvis de mangler (gør scriptet mere robust)
-    existing = {r[1] for r in con.execute("PRAGMA table_info(pages);").fetchall()}
-    wanted = {
-        "left_titles_json": "TEXT",
-        "left_nr": "TEXT",
-        "left_scale": "TEXT",
-        "left_confidence": "REAL",
-        "left_source": "TEXT",
-    }
-    for col, typ in wanted.items():
-        if col not in existing:
-            con.execute(f"ALTER TABLE pages ADD COLUMN {col} {typ};")
-    con.commit()
+    out = json.loads(resp.output_text)
+    llm_cache.put(key, out)
+    return out
 
 def main():
     if not os.getenv("OPENAI_API_KEY"):
@@ -83,15 +79,18 @@ def main():
     con = sqlite3.connect(DB_PATH)
     con.row_factory = sqlite3.Row
 
-    ensure_columns(con)
+    # tilføjer left_*-kolonner hvis de mangler + page_labels-triggers
+    ensure_schema(con)
 
     rows = con.execute("""
         SELECT
           p.id AS page_id,
           p.page_no,
-          d.path AS pdf_path
+          d.path AS pdf_path,
+          pd.path AS left_path
         FROM pages p
         JOIN documents d ON d.id = p.document_id
+        LEFT JOIN page_derivatives pd ON pd.page_id = p.id AND pd.kind = 'left'
         WHERE COALESCE(p.left_source,'') = ''
         ORDER BY p.id ASC
     """).fetchall()
@@ -104,7 +103,9 @@ def main():
         pdf_path = r["pdf_path"]
 
         try:
-            img = render_left_half_png(pdf_path, page_no, zoom=2.0)
+            # venstre halvdel fra ingest-render-passet; ellers render fra PDF
+            left = resolve(r["left_path"])
+            img = left.read_bytes() if left else render_left_half_png(pdf_path, page_no, zoom=2.0)
             out = llm_extract(img)
 
             titles = out.get("titles") or []
@@ -2,24 +2,31 @@ import argparse
 import base64
 import io
 import json
+import random
 import re
 import sqlite3
+import threading
 import time
 from pathlib import Path
 
 from openai import OpenAI
 from PIL import Image
 
+import llm_cache
+from archive_db import ensure_schema, mark_stage
+from derivatives import encode_llm_jpeg
+
 DB = Path("app/app.db")
-client = OpenAI()
+MODEL = "gpt-4.1-mini"
+# egen backoff nedenfor; OPENAI_BASE_URL kan pege på scripts/fake_responses_api.py
+client = OpenAI(max_retries=0)
 
 PROMPT = r"""
-Du får et billede af en scannet side (opslag).
-DU MÅ KUN bruge VENSTRE side (tegning + overskrifter + nr nederst).
-Ignorér højre side tekst fuldstændigt.
+Du får et billede af venstre side af et scannet opslag
+(tegning + overskrifter + nr nederst).
 
 Opgave:
-A) Find ALLE tydelige overskrifter på venstre side (typisk 2-5).
+A) Find ALLE tydelige overskrifter på siden (typisk 2-5).
    - Returnér dem i læseorden (top → bund).
 B) Find "Nr." nederst.
 C) Find målestok(e).
@@ -29,9 +36,107 @@ SVAR KUN MED JSON:
 {"titles":["..."],"nr":"...","scale":"...","confidence":0.0}
 """.strip()
 
+# tælles op når save_result/clean_titles ændrer hvad der gemmes
+LABEL_VERSION = 1
+
+
+def label_settings() -> dict:
+    """Det der ud over billedet bestemmer labels; indgår i 'labelled'-fingerprintet (pipeline.py)."""
+    return {"version": LABEL_VERSION, "model": MODEL, "prompt": PROMPT}
+
+
 MAX_RETRIES = 6
 BASE_SLEEP = 2
-MAX_UPLOAD_BYTES = 900_000
+MAX_SLEEP = 60
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RPM = 60
+DEFAULT_TPM = 0  # 0 = ingen token-grænse
+# gæt på tokens pr. kald før svaret kendes; rettes til med resp.usage bagefter
+EST_TOKENS_PER_REQUEST = 1500
+
+
+class TokenBucket:
+    """Token bucket: `per_minute` enheder pr. minut, med burst op til `burst`.
+
+    acquire() blokerer til der er dækning. debit() trækker ekstra (fx når det
+    faktiske token-forbrug var større end gættet) og må gerne gå i minus.
+    """
+
+    def __init__(self, per_minute: float, burst: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, per_minute / 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n: float = 1.0):
+        n = min(n, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def debit(self, n: float):
+        with self.lock:
+            self._refill()
+            self.tokens -= n
+
+
+class Limits:
+    """Fælles rate limits for alle worker-tråde (None = ubegrænset)."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+
+    def before_call(self):
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens:
+            self.tokens.acquire(EST_TOKENS_PER_REQUEST)
+
+    def after_call(self, used_tokens: int):
+        if self.tokens and used_tokens:
+            self.tokens.debit(used_tokens - EST_TOKENS_PER_REQUEST)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.tokens = 0
+        self.llm_seconds = 0.0
+
+    def add(self, **kw):
+        with self.lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {k: getattr(self, k) for k in ("calls", "cache_hits", "retries", "tokens", "llm_seconds")}
+
+
+LIMITS = Limits(DEFAULT_RPM, DEFAULT_TPM)
+STATS = Stats()
+
+
+def backoff_sleep(attempt: int) -> float:
+    # eksponentiel backoff med "full jitter"
+    cap = min(MAX_SLEEP, BASE_SLEEP * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
 
 
 def connect():
@@ -52,24 +157,15 @@ def resolve_thumb(thumb_path: str) -> Path | None:
     return None
 
 
-def compress_for_llm(path: Path) -> str:
-    raw = path.read_bytes()
-    img = Image.open(io.BytesIO(raw)).convert("RGB")
+def to_data_url(jpeg: bytes) -> str:
+    b64 = base64.b64encode(jpeg).decode("ascii")
+    return f"data:image/jpeg;base64,{b64}"
 
-    max_w = 1400
-    if img.width > max_w:
-        ratio = max_w / img.width
-        img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.LANCZOS)
 
-    q = 70
-    while True:
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=q, optimize=True)
-        data = buf.getvalue()
-        if len(data) <= MAX_UPLOAD_BYTES or q <= 35:
-            b64 = base64.b64encode(data).decode("ascii")
-            return f"data:image/jpeg;base64,{b64}"
-        q -= 7
+def compress_for_llm(path: Path) -> str:
+    # kun til sider importeret før ingest lavede 'llm'-afledningen
+    img = Image.open(io.BytesIO(path.read_bytes()))
+    return to_data_url(encode_llm_jpeg(img))
 
 
 def extract_json(text: str) -> dict:
@@ -82,12 +178,23 @@ def extract_json(text: str) -> dict:
     return json.loads(m.group(0))
 
 
-def call_llm(image_data_url: str) -> dict:
+def call_llm(image_data_url: str, limits: Limits | None = None) -> dict:
+    # limits=None: de fælles LIMITS for processen
+    limits = limits or LIMITS
+    # data-URL'en er præcis de billedbytes der sendes, så den indgår i nøglen
+    key = llm_cache.cache_key(image_data_url.encode("ascii"), PROMPT, MODEL)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        STATS.add(cache_hits=1)
+        return cached
+
     last_error = None
     for attempt in range(1, MAX_RETRIES + 1):
         try:
+            limits.before_call()
+            t0 = time.monotonic()
             resp = client.responses.create(
-                model="gpt-4.1-mini",
+                model=MODEL,
                 input=[{
                     "role": "user",
                     "content": [
@@ -96,115 +203,155 @@ def call_llm(image_data_url: str) -> dict:
                     ],
                 }],
             )
+            usage = getattr(resp, "usage", None)
+            used = int(getattr(usage, "total_tokens", 0) or 0)
+            limits.after_call(used)
+            STATS.add(calls=1, tokens=used, llm_seconds=time.monotonic() - t0)
 
             out_text = getattr(resp, "output_text", None)
             if out_text:
-                return extract_json(out_text)
-
-            chunks = []
-            for item in getattr(resp, "output", []) or []:
-                for c in item.get("content", []):
-                    if c.get("type") in ("output_text", "text"):
-                        chunks.append(c.get("text", ""))
-            return extract_json("\n".join(chunks))
+                out = extract_json(out_text)
+            else:
+                chunks = []
+                for item in getattr(resp, "output", []) or []:
+                    for c in item.get("content", []):
+                        if c.get("type") in ("output_text", "text"):
+                            chunks.append(c.get("text", ""))
+                out = extract_json("\n".join(chunks))
+
+            llm_cache.put(key, out)
+            return out
 
         except Exception as e:
             last_error = e
-            time.sleep(BASE_SLEEP * attempt)
+            if attempt < MAX_RETRIES:
+                STATS.add(retries=1)
+                time.sleep(backoff_sleep(attempt))
 
     raise last_error
 
 
+def enrich_page(thumb: Path | None, llm_image: Path | None, limits: Limits | None = None) -> dict:
+    """Worker-del: billede + LLM. Ingen DB-adgang her (main-tråden skriver)."""
+    if llm_image:
+        # færdig upload-JPEG fra ingest-render-passet
+        img_url = to_data_url(llm_image.read_bytes())
+    else:
+        img_url = compress_for_llm(thumb)
+    return call_llm(img_url, limits)
+
+
+def clean_titles(titles) -> list[str]:
+    cleaned = []
+    seen = set()
+    for t in titles:
+        t = str(t).strip()
+        if not t:
+            continue
+        t = t[:90]
+        key = t.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        cleaned.append(t)
+    return cleaned
+
+
+def save_result(con, page_id: int, out: dict, fingerprint: str | None = None,
+                source: str = "llm:v2:missing") -> float:
+    titles = out.get("titles") or []
+    nr = (out.get("nr") or "").strip()
+    scale = (out.get("scale") or "").strip()
+    conf = float(out.get("confidence") or 0.0)
+
+    cleaned = clean_titles(titles)
+
+    # ✅ TRIN 2: byg search blob til substring fallback + FTS source
+    search_blob = " ".join([*cleaned[:5], nr, scale]).strip()
+
+    con.execute("""
+        UPDATE pages
+        SET left_titles_json_v2=?,
+            left_nr_v2=?,
+            left_scale_v2=?,
+            left_confidence_v2=?,
+            left_source_v2=?,
+            left_search_text_v2=?
+        WHERE id=?
+    """, (
+        json.dumps(cleaned[:5], ensure_ascii=False),
+        nr,
+        scale,
+        conf,
+        source,
+        search_blob,
+        page_id
+    ))
+    mark_stage(con, "labelled", [page_id], fingerprint)
+    con.commit()
+    return conf
+
+
+def print_report(n_ok: int, n_err: int, n_skip: int, elapsed: float, concurrency: int, stats: dict,
+                 n_reused: int = 0, n_ocr: int = 0, n_escalated: int = 0):
+    done = n_ok + n_err + n_reused
+    rate = (done / elapsed * 60) if elapsed > 0 else 0.0
+    avg = (stats["llm_seconds"] / stats["calls"]) if stats["calls"] else 0.0
+    print(
+        f"THROUGHPUT pages={done} ok={n_ok} reused={n_reused} errors={n_err} missing_thumb={n_skip} "
+        f"elapsed={elapsed:.1f}s pages_per_min={rate:.1f} concurrency={concurrency} "
+        f"llm_calls={stats['calls']} cache_hits={stats['cache_hits']} retries={stats['retries']} "
+        f"avg_llm_latency={avg:.2f}s tokens={stats['tokens']}",
+        flush=True,
+    )
+    if n_ocr or n_escalated:
+        # andel af OCR-forsøgte sider der alligevel endte hos LLM'en
+        escalation = n_escalated / (n_ocr + n_escalated) * 100
+        print(f"CASCADE ocr={n_ocr} escalated={n_escalated} escalation_rate={escalation:.1f}%", flush=True)
+
+
 def main():
+    from pipeline import enrich
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--document-id", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="samtidige LLM-kald")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_RPM,
+                        help="max requests pr. minut (0 = ubegrænset)")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TPM,
+                        help="max tokens pr. minut (0 = ubegrænset)")
+    parser.add_argument("--ocr-threshold", type=float, default=None,
+                        help="OCR først; kun sider med OCR-confidence under tærsklen går til LLM'en (fx 0.85)")
     args = parser.parse_args()
 
     con = connect()
-
-    if args.document_id is None:
-        rows = con.execute("""
-            SELECT id, page_no, thumb_path
-            FROM pages
-            WHERE left_source_v2 IS NULL
-            ORDER BY id
-        """).fetchall()
-        print(f"Pages to enrich (missing): {len(rows)}")
-    else:
-        rows = con.execute("""
-            SELECT id, page_no, thumb_path
-            FROM pages
-            WHERE document_id = ?
-              AND left_source_v2 IS NULL
-            ORDER BY id
-        """, (args.document_id,)).fetchall()
-        print(f"Pages to enrich (missing, doc={args.document_id}): {len(rows)}")
-
-    for i, r in enumerate(rows, 1):
-        page_id = r["id"]
-        page_no = r["page_no"]
-        thumb = resolve_thumb(r["thumb_path"])
-
-        if not thumb:
-            print(f"[{i}/{len(rows)}] page_id={page_id} side={page_no} MISSING_THUMB")
-            continue
-
-        try:
-            img_url = compress_for_llm(thumb)
-            out = call_llm(img_url)
-
-            titles = out.get("titles") or []
-            nr = (out.get("nr") or "").strip()
-            scale = (out.get("scale") or "").strip()
-            conf = float(out.get("confidence") or 0.0)
-
-            cleaned = []
-            seen = set()
-            for t in titles:
-                t = str(t).strip()
-                if not t:
-                    continue
-                t = t[:90]
-                key = t.lower()
-                if key in seen:
-                    continue
-                seen.add(key)
-                cleaned.append(t)
-
-            # ✅ TRIN 2: byg search blob til substring fallback + FTS source
-            search_blob = " ".join([*cleaned[:5], nr, scale]).strip()
-
-            con.execute("""
-                UPDATE pages
-                SET left_titles_json_v2=?,
-                    left_nr_v2=?,
-                    left_scale_v2=?,
-                    left_confidence_v2=?,
-                    left_source_v2=?,
-                    left_search_text_v2=?
-                WHERE id=?
-            """, (
-                json.dumps(cleaned[:5], ensure_ascii=False),
-                nr,
-                scale,
-                conf,
-                "llm:v2:missing",
-                search_blob,
-                page_id
-            ))
-            con.commit()
-
-            print(f"[{i}/{len(rows)}] page_id={page_id} OK conf={conf:.2f}")
-
-        except Exception as e:
-            con.execute("""
-                UPDATE pages
-                SET left_source_v2=?
-                WHERE id=?
-            """, (f"llm_error_v2:{type(e).__name__}", page_id))
-            con.commit()
-
-            print(f"[{i}/{len(rows)}] page_id={page_id} ERROR: {e}")
+    # page_labels opdateres af triggers, når vi skriver left_*_v2
+    ensure_schema(con)
+
+    for ev in enrich(con, args.document_id, args.concurrency, args.rpm, args.tpm,
+                     ocr_threshold=args.ocr_threshold):
+        if ev["event"] == "start":
+            if args.document_id is None:
+                print(f"Pages to enrich (missing): {ev['n']}")
+            else:
+                print(f"Pages to enrich (missing, doc={args.document_id}): {ev['n']}")
+        elif ev["event"] == "page":
+            head = f"[{ev['i']}/{ev['n']}] page_id={ev['page_id']}"
+            if ev["status"] == "ok":
+                src = " (ocr)" if ev["source"] == "ocr" else ""
+                print(f"{head} OK conf={ev['conf']:.2f}{src}", flush=True)
+            elif ev["status"] == "reused":
+                print(f"{head} REUSED from={ev['source_page_id']} dist={ev['distance']}", flush=True)
+            elif ev["status"] == "error":
+                print(f"{head} ERROR: {ev['error']}", flush=True)
+            else:
+                print(f"{head} side={ev['page_no']} MISSING_THUMB", flush=True)
+        elif ev["event"] == "done":
+            print_report(ev["ok"], ev["errors"], ev["missing"], ev["elapsed"], ev["concurrency"],
+                         ev["stats"], ev["reused"], ev["ocr"], ev["escalated"])
+            if ev["ocr_error"]:
+                print(f"OCR failed, pages sent to LLM: {ev['ocr_error']}", flush=True)
 
     con.close()
 
@@ -0,0 +1,167 @@
+"""Lokal OCR af venstre side: titel, "Nr." og målestok uden LLM-kald.
+
+Første trin i pipeline.enrich(ocr_threshold=...): venstre halvdel OCR'es
+med tesseract, felterne findes med regex, og en samlet confidence beregnes
+ud fra tesseracts ord-confidence. Kun sider under tærsklen sendes videre
+til LLM'en.
+
+Siderne er bygget ens op: overskriften "<emne> - ved <navn>, <sted>"
+øverst, "Nr. 123" og målestok ("1:2", "1:2,5") nederst. OCR giver kun
+hovedtitlen; underoverskrifter (fx "Forstykke") kræver LLM'en.
+
+read_nr() læser kun "Nr." og bruges af pipeline.enrich, før en side arver
+labels fra en side med næsten samme phash.
+
+image_to_text() er ren tekst-OCR til pages.key_text (build_key_text.py).
+Med tesserocr holdes én tesseract-API åben pr. tråd, så sprogmodellen kun
+indlæses én gang; uden tesserocr bruges pytesseract.
+"""
+import re
+import threading
+from functools import lru_cache
+
+from PIL import Image, ImageOps
+
+OCR_LANG = "dan+eng"  # dansk hjælper på æøå
+OCR_CONFIG = "--psm 6"
+OCR_VERSION = 1  # tælles op når udtræk/scoring ændres (indgår i 'labelled'-fingerprintet)
+
+TITLE_REGION = 0.35  # titlen står i den øverste del af siden
+NR_REGION = 0.65  # "Nr." står under denne andel af højden
+MIN_TITLE_LETTERS = 8
+NO_SCALE_PENALTY = 0.8  # de fleste sider har en målestok; mangler den, er OCR'en nok dårlig
+
+NR_RE = re.compile(r"\bN[rR][.,]?\s*(\d{1,4})\b")
+SCALE_RE = re.compile(r"(?<![\d:])(\d{1,2})\s*:\s*(\d{1,2}(?:,\d)?)(?![\d:])")
+TITLE_RE = re.compile(r"\bved\b", re.IGNORECASE)
+LETTER_RE = re.compile(r"[A-Za-zÆØÅæøå]")
+
+_local = threading.local()  # tesserocr-API'en må ikke deles mellem tråde
+
+
+@lru_cache(maxsize=None)
+def engine() -> str:
+    try:
+        import tesserocr  # noqa: F401
+        return "tesserocr"
+    except ImportError:
+        return "pytesseract"
+
+
+def image_to_text(img: Image.Image) -> str:
+    """OCR af hele billedet som én tekstblok (OCR_LANG, OCR_CONFIG), uden midlertidige filer."""
+    if engine() == "tesserocr":
+        import tesserocr
+
+        api = getattr(_local, "api", None)
+        if api is None:
+            api = _local.api = tesserocr.PyTessBaseAPI(lang=OCR_LANG, psm=tesserocr.PSM.SINGLE_BLOCK)
+        api.SetImage(img)
+        return api.GetUTF8Text()
+
+    import pytesseract
+    return pytesseract.image_to_string(img, lang=OCR_LANG, config=OCR_CONFIG)
+
+
+def ocr_lines(img: Image.Image) -> list[dict]:
+    """Tesseract-linjer: [{"text", "conf" (0-1, gennemsnit af ordene), "top" (0-1 af højden)}]."""
+    import pytesseract
+
+    img = ImageOps.autocontrast(img.convert("L"))
+    data = pytesseract.image_to_data(
+        img, lang=OCR_LANG, config=OCR_CONFIG, output_type=pytesseract.Output.DICT
+    )
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        conf = float(data["conf"][i])
+        if not word or conf < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        line = lines.setdefault(key, {"words": [], "confs": [], "top": data["top"][i]})
+        line["words"].append(word)
+        # tegnsætning og støj får lav confidence; kun ord med bogstaver/tal tæller
+        if LETTER_RE.search(word) or word.isdigit():
+            line["confs"].append(conf / 100)
+        line["top"] = min(line["top"], data["top"][i])
+
+    out = []
+    for line in lines.values():
+        confs = line["confs"] or [0.0]
+        out.append({
+            "text": " ".join(line["words"]),
+            "conf": sum(confs) / len(confs),
+            "top": line["top"] / img.height,
+        })
+    out.sort(key=lambda l: l["top"])
+    return out
+
+
+def _clean_title(text: str) -> str:
+    # OCR-støj før første bogstav og efter sidste (rammer, streger)
+    text = re.sub(r"^[^A-Za-zÆØÅæøå]+", "", text)
+    text = re.sub(r"[^A-Za-zÆØÅæøå0-9.)]+$", "", text)
+    text = re.sub(r"\s*-\s*", " - ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def extract(lines: list[dict]) -> dict:
+    """Titel, nr og målestok fra OCR-linjer; samme form som LLM-svaret."""
+    title, title_conf = "", 0.0
+    for line in lines:
+        if line["top"] > TITLE_REGION:
+            break
+        if TITLE_RE.search(line["text"]):
+            cand = _clean_title(line["text"])
+            if len(LETTER_RE.findall(cand)) >= MIN_TITLE_LETTERS:
+                title, title_conf = cand, line["conf"]
+                break
+
+    nr, nr_conf = "", 0.0
+    for line in reversed(lines):  # nr står nederst
+        m = NR_RE.search(line["text"])
+        if m:
+            nr, nr_conf = f"Nr. {m.group(1)}", line["conf"]
+            break
+
+    scales = []
+    for line in lines:
+        for a, b in SCALE_RE.findall(line["text"]):
+            s = f"{a}:{b}"
+            if s not in scales:
+                scales.append(s)
+
+    conf = min(title_conf, nr_conf) if title and nr else 0.0
+    if not scales:
+        conf *= NO_SCALE_PENALTY
+    return {
+        "titles": [title] if title else [],
+        "nr": nr,
+        "scale": ", ".join(scales),
+        "confidence": round(conf, 2),
+    }
+
+
+def read_labels(path) -> dict:
+    with Image.open(path) as img:
+        return extract(ocr_lines(img))
+
+
+def nr_digits(text: str | None) -> str:
+    """Tallet i et nr-felt ("Nr. 012" -> "12"); "" hvis der ikke er noget."""
+    m = re.search(r"\d{1,4}", text or "")
+    return str(int(m.group(0))) if m else ""
+
+
+def read_nr(path) -> str:
+    """Tallet efter "Nr." nederst på venstre side (som nr_digits); "" hvis det ikke findes."""
+    with Image.open(path) as img:
+        img = ImageOps.autocontrast(img.convert("L"))
+        crop = img.crop((0, int(img.height * NR_REGION), img.width, img.height))
+        m = NR_RE.search(image_to_text(crop))
+    return nr_digits(m.group(1)) if m else ""
+
+
+def settings() -> dict:
+    """Indgår i 'labelled'-fingerprintet for sider labelet med OCR (pipeline.py)."""
+    return {"version": OCR_VERSION, "lang": OCR_LANG, "config": OCR_CONFIG}
@@ -0,0 +1,100 @@
+"""Disk-cache af enkeltside-PDF'er til /view og /download.
+
+Nøglen er (PDF-sti, mtime, sidenummer), så en udskiftet kilde-PDF aldrig
+giver en forældet side. Filerne ligger i data/page_cache/<2 tegn>/<sha1>.pdf
+og serveres direkte med send_file; mtime bruges som LRU-tidsstempel og de
+ældste slettes når cachen bliver for stor.
+
+Ved cache-miss hentes siden fra en lille pulje af åbne fitz-dokumenter, så
+store PDF'er ikke parses forfra (xref mm.) for hver side. Web-appen lader
+udtrækket køre i pdf_workers-processer (hver med sin egen pulje).
+
+PAGE_CACHE_MAX_MB sætter loftet (default 500).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from disk_lru import DiskLRU, write_atomic
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT / "data" / "page_cache"
+MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_MB", "500")) * 1024 * 1024
+DOC_POOL_SIZE = 8
+
+_lru = DiskLRU(CACHE_DIR, "*/*.pdf", MAX_BYTES)
+
+
+class DocPool:
+    """LRU-pulje af åbne fitz-dokumenter, nøgle (sti, mtime).
+
+    PyMuPDF er ikke trådsikkert, så al brug af dokumenterne sker under lock.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.docs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def extract_page(self, pdf_path: str, mtime_ns: int, page_no_1based: int) -> bytes:
+        import fitz  # PyMuPDF
+
+        with self.lock:
+            key = (pdf_path, mtime_ns)
+            doc = self.docs.pop(key, None)
+            if doc is None:
+                doc = fitz.open(pdf_path)
+            self.docs[key] = doc
+            while len(self.docs) > self.size:
+                _, old = self.docs.popitem(last=False)
+                old.close()
+
+            idx = max(0, int(page_no_1based) - 1)
+            if idx >= doc.page_count:
+                raise ValueError("Ugyldigt sidetal")
+            out = fitz.open()
+            try:
+                out.insert_pdf(doc, from_page=idx, to_page=idx)
+                return out.tobytes()
+            finally:
+                out.close()
+
+
+_docs = DocPool(DOC_POOL_SIZE)
+
+
+def _path(pdf_path: str, mtime_ns: int, page_no: int) -> Path:
+    key = hashlib.sha1(f"{pdf_path}\0{mtime_ns}\0{page_no}".encode("utf-8")).hexdigest()
+    return CACHE_DIR / key[:2] / f"{key}.pdf"
+
+
+def extract_to_file(pdf_path: str, mtime_ns: int, page_no_1based: int, dest: str) -> int:
+    """Udtræk siden til dest (atomisk). Returnerer filstørrelsen.
+
+    Kører i en pdf_workers-proces, når web-appen bruger en; filen skrives
+    dér, så sidens bytes ikke skal sendes tilbage gennem en pipe.
+    """
+    data = _docs.extract_page(pdf_path, mtime_ns, page_no_1based)
+    write_atomic(Path(dest), data)
+    return len(data)
+
+
+def single_page_pdf(pdf_path: str, page_no_1based: int, run=None) -> Path:
+    """Sti til en PDF med kun den ene side (fra cachen eller lavet nu).
+
+    run(fn, *args) bestemmer hvor udtrækket sker ved cache-miss, fx
+    pdf_workers.PdfWorkers.run; uden run sker det i den kaldende tråd.
+    """
+    src = Path(pdf_path).resolve()
+    mtime_ns = src.stat().st_mtime_ns
+    p = _path(str(src), mtime_ns, int(page_no_1based))
+    if _lru.touch(p):  # LRU: senest brugt
+        return p
+
+    args = (str(src), mtime_ns, int(page_no_1based), str(p))
+    size = run(extract_to_file, *args) if run else extract_to_file(*args)
+
+    _lru.added(size, keep=p)
+    return p
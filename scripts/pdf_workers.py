@@ -0,0 +1,130 @@
+"""Procespulje til PyMuPDF-arbejde fra web-appen.
+
+fitz holder GIL'en mens den parser og renderer, så én tung download i en
+request-tråd kan stoppe alle andre requests. Arbejdet sendes derfor til
+et fast antal worker-processer, hver med sin egen pipe:
+
+  - højst max_pending opgaver ad gangen (kørende + ventende); ellers Busy,
+    som web-appen svarer 503 + Retry-After på
+  - en opgave venter på en ledig worker uden tidsgrænse (køen er begrænset
+    af max_pending); timeouten tæller først fra workeren får opgaven
+  - ved TaskTimeout stoppes kun den hængende worker og erstattes af en ny,
+    så opgaver der kører i de andre workers ikke rammes
+
+PDF_WORKERS og PDF_TASK_TIMEOUT kan sættes i miljøet.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+
+DEFAULT_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+DEFAULT_TIMEOUT = float(os.getenv("PDF_TASK_TIMEOUT", "30"))
+
+
+class Busy(Exception):
+    """Køen er fuld; prøv igen om lidt."""
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class WorkerDied(Exception):
+    pass
+
+
+def _worker_main(conn):
+    # importér fitz én gang pr. worker i stedet for ved første opgave
+    import fitz  # noqa: F401  PyMuPDF
+
+    while True:
+        try:
+            fn, args = conn.recv()
+        except EOFError:
+            return  # web-processen er lukket
+        try:
+            conn.send((True, fn(*args)))
+        except Exception as e:
+            try:
+                conn.send((False, e))
+            except Exception:  # undtagelsen kan ikke pickles
+                conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        self.proc.start()
+        child.close()
+
+    def kill(self):
+        self.proc.terminate()
+        self.proc.join(timeout=5)
+        self.conn.close()
+
+
+class PdfWorkers:
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int | None = None,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        # spawn: web-processen har tråde, og fork af en trådet proces er ikke sikkert
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.LifoQueue()  # senest brugte worker først (varm cache)
+        self._started = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> _Worker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            start = self._started < self.workers
+            if start:
+                self._started += 1
+        if start:
+            try:
+                return _Worker(self._ctx)
+            except BaseException:
+                with self._lock:
+                    self._started -= 1
+                raise
+        return self._idle.get()  # alle workers er optaget; vent i køen
+
+    def _discard(self, worker: _Worker):
+        # en ny worker startes først når den næste opgave skal bruge den
+        worker.kill()
+        with self._lock:
+            self._started -= 1
+
+    def run(self, fn, *args, timeout: float | None = None):
+        """Kør fn(*args) i en worker og returnér resultatet (blokerer den kaldende tråd)."""
+        if not self._slots.acquire(blocking=False):
+            raise Busy()
+        try:
+            worker = self._acquire()
+            timeout = timeout or self.timeout
+            try:
+                try:
+                    worker.conn.send((fn, args))
+                except (TypeError, AttributeError, ValueError):
+                    # opgaven kan ikke pickles; workeren har intet modtaget
+                    self._idle.put(worker)
+                    raise
+                if not worker.conn.poll(timeout):
+                    self._discard(worker)
+                    raise TaskTimeout(f"PDF-opgaven tog mere end {timeout:.0f}s")
+                ok, result = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                self._discard(worker)
+                raise WorkerDied(f"PDF-worker stoppede uventet: {e}") from None
+            self._idle.put(worker)
+            if not ok:
+                raise result
+            return result
+        finally:
+            self._slots.release()
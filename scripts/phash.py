@@ -0,0 +1,80 @@
+"""Perceptuel hash (dHash) af sider og BK-træ til opslag på Hamming-afstand.
+
+Samme modeltegning er genoptrykt i flere årgange; en ny side, hvis venstre
+halvdel ligger inden for MAX_DISTANCE af en allerede labelet side, kan arve
+dens labels i stedet for et nyt LLM-kald, hvis nr'et også stemmer
+(se pipeline.enrich).
+
+Hashen er en dHash på HASH_SIZE x HASH_SIZE (256 bit), gemt som hex i
+pages.phash. 64 bit er for groft til streg-tegninger på hvid baggrund.
+"""
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 16
+# max antal forskellige bits (af 256) for at regne to sider for samme tegning.
+# På arkivets sider ligger forskellige tegninger >= ~70 fra hinanden, mens
+# samme side efter ny skalering/JPEG/forskydning ligger under ~16.
+MAX_DISTANCE = 24
+
+
+def dhash(img: Image.Image) -> str:
+    """dHash: gråtone, skaler til (HASH_SIZE+1) x HASH_SIZE og sammenlign naboer vandret."""
+    small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    px = np.asarray(small, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+
+def left_dhash(img: Image.Image) -> str:
+    """dHash af venstre halvdel (tegning + labels); højre side kan variere mellem oplag."""
+    return dhash(img.crop((0, 0, img.width // 2, img.height)))
+
+
+def distance(a: str, b: str) -> int:
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller-træ over hashes; search() besøger kun grene der kan ligge inden for afstanden."""
+
+    def __init__(self):
+        self.root = None  # [hash, value, {afstand: barn}]
+        self.size = 0
+
+    def add(self, h: str, value):
+        node = [int(h, 16), value, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        cur = self.root
+        while True:
+            d = (node[0] ^ cur[0]).bit_count()
+            child = cur[2].get(d)
+            if child is None:
+                cur[2][d] = node
+                return
+            cur = child
+
+    def search(self, h: str, max_distance: int = MAX_DISTANCE) -> list[tuple[int, object]]:
+        """Alle (afstand, value) inden for max_distance, nærmeste først."""
+        if self.root is None:
+            return []
+        x = int(h, 16)
+        out = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = (x ^ node[0]).bit_count()
+            if d <= max_distance:
+                out.append((d, node[1]))
+            for cd, child in node[2].items():
+                if d - max_distance <= cd <= d + max_distance:
+                    stack.append(child)
+        out.sort(key=lambda t: t[0])
+        return out
+
+    def nearest(self, h: str, max_distance: int = MAX_DISTANCE):
+        hits = self.search(h, max_distance)
+        return hits[0] if hits else None
@@ -0,0 +1,716 @@
+"""Import-pipeline: ingest -> enrich -> index, kørt i samme proces.
+
+Hvert trin er en generator, der udfører arbejdet og undervejs yielder
+events som dicts: {"stage": "ingest"|"enrich"|"index", "event": ..., ...}.
+
+  ingest   document (document_id, pages[, resumed]) | duplicate (document_id, filename),
+           progress (i, n), done (document_id)
+  enrich   start (n), page (i, n, page_id, status, conf+source|error|source_page_id),
+           done (ok, errors, missing, reused, ocr, escalated, elapsed, stats)
+  index    done (inserted, skipped)
+
+Hvert trin noterer færdige sider i page_stages (rendered, labelled,
+indexed) i samme transaktion som resultatet; kører et trin igen, laver det
+kun de sider der mangler.
+
+run_import() sætter trinnene sammen. Web-appens import-jobs og CLI-scripts
+(ingest_pdf.py, llm_left_labels_v2.py, update_left_fts_for_document.py)
+bruger funktionerne direkte i stedet for at parse hinandens stdout.
+
+Forbindelsen kommer fra kalderen, som også har kørt ensure_schema().
+Tunge moduler (fitz, openai) importeres først når trinnet køres.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+PDFS_DIR = ROOT / "data" / "pdfs"
+
+# sider pr. opgave til en render-worker og pr. DB-transaktion
+CHUNK_PAGES = 4
+COMMIT_EVERY = 16
+# OCR først i enrich for import-jobs; sider under tærsklen går til LLM'en (tom = kun LLM)
+OCR_THRESHOLD = float(os.environ["ENRICH_OCR_THRESHOLD"]) if os.getenv("ENRICH_OCR_THRESHOLD") else None
+
+
+def safe_stem(name: str) -> str:
+    s = (name or "").strip()
+    s = re.sub(r"\.pdf$", "", s, flags=re.IGNORECASE)
+    s = re.sub(r"[^\wæøåÆØÅ0-9\- ]+", "", s, flags=re.UNICODE)
+    s = re.sub(r"\s+", "_", s).strip("_")
+    return s[:80] if s else "doc"
+
+
+# ---------- modtagelse af PDF (hash mens der skrives) ----------
+
+RECEIVE_CHUNK = 1 << 20
+STALE_PART_SECONDS = 3600  # en .part der ikke er skrevet i så længe, er efterladt af et nedbrud
+
+
+class UploadPart:
+    """Midlertidig .part-fil i dst_dir der hasher alt hvad der skrives i den.
+
+    Web-appen lader Werkzeugs form-parser skrive uploaden direkte heri
+    (stream_factory), så filen hverken spooles et andet sted eller kopieres.
+    """
+
+    def __init__(self, dst_dir: Path = PDFS_DIR):
+        dst_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dst_dir, suffix=".part")
+        self.path = Path(tmp)
+        self._f = os.fdopen(fd, "w+b")
+        self._sha = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self._sha.update(data)
+        return self._f.write(data)
+
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+    def discard(self):
+        self._f.close()
+        self.path.unlink(missing_ok=True)
+
+    def __getattr__(self, name):
+        # read/seek/flush/close m.fl. går til filen
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+def receive_pdf(stream, dst_dir: Path = PDFS_DIR) -> tuple[Path, str]:
+    """Skriv stream til en midlertidig fil i dst_dir og hash undervejs.
+
+    Filen ligger på samme filsystem som arkivet, så place_pdf() blot
+    omdøber den. Returnerer (midlertidig sti, sha256).
+    """
+    part = UploadPart(dst_dir)
+    try:
+        with part:
+            while chunk := stream.read(RECEIVE_CHUNK):
+                part.write(chunk)
+    except BaseException:
+        part.discard()
+        raise
+    return part.path, part.hexdigest()
+
+
+def sweep_stale_parts(dst_dir: Path = PDFS_DIR) -> int:
+    """Slet .part-filer efterladt af afbrudte uploads. Returnerer antal slettede."""
+    n = 0
+    cutoff = time.time() - STALE_PART_SECONDS
+    for p in dst_dir.glob("*.part"):
+        try:
+            if p.stat().st_mtime < cutoff:
+                p.unlink()
+                n += 1
+        except FileNotFoundError:
+            pass  # allerede placeret eller slettet af en anden
+    return n
+
+
+def place_pdf(tmp: Path, filename: str, dst_dir: Path = PDFS_DIR) -> Path:
+    """Giv en modtaget fil sit endelige, unikke navn i dst_dir (uden kopi)."""
+    base = safe_stem(Path(filename).name)
+    i = 1
+    while True:
+        cand = dst_dir / (f"{base}.pdf" if i == 1 else f"{base}_{i}.pdf")
+        try:
+            os.link(tmp, cand)  # fejler hvis navnet er taget, også ved samtidige uploads
+        except FileExistsError:
+            i += 1
+            continue
+        tmp.unlink()
+        return cand
+
+
+def find_document_by_sha256(con, sha256: str):
+    return con.execute(
+        "SELECT id, path, filename, category FROM documents WHERE sha256 = ?", (sha256,)
+    ).fetchone()
+
+
+# ---------- fingerprints (page_stages.fingerprint) ----------
+#
+# render (inkl. llm-JPEG) -> labels -> FTS. Hvert trin gemmer et hash af sine
+# input; afviger det fra det aktuelle, er siden forældet og arkiv.py rebuild
+# laver trinnet om. Labels afhænger af llm-billedets sha256, så en ny
+# rendering kun gør labels forældede hvis billedet faktisk ændrede sig.
+
+def _digest(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def _settings_digest(stage: str) -> str:
+    if stage == "rendered":
+        from derivatives import render_settings
+        return _digest(render_settings())
+    if stage == "labelled":
+        import llm_left_labels_v2 as v2
+        return _digest(v2.label_settings())
+    if stage == "ocr":
+        import ocr_labels
+        return _digest(ocr_labels.settings())
+    from archive_db import _LEFT_TRGM_LABEL, FTS_VERSION
+    return _digest({"version": FTS_VERSION, "trgm_label": _LEFT_TRGM_LABEL})
+
+
+def render_fingerprint(pdf_sha256: str | None, page_no: int) -> str:
+    return _digest([_settings_digest("rendered"), pdf_sha256, page_no])
+
+
+def label_fingerprint(image_sha256: str | None) -> str:
+    return _digest([_settings_digest("labelled"), image_sha256])
+
+
+def ocr_label_fingerprint(left_sha256: str | None) -> str:
+    """Labels fundet med OCR afhænger af venstre-billedet og OCR-opsætningen, ikke af prompt/model."""
+    return _digest([_settings_digest("ocr"), left_sha256])
+
+
+def index_fingerprint() -> str:
+    return _settings_digest("indexed")
+
+
+# input til fingerprintet pr. trin: (a, b) ved siden af page_id, document_id, fingerprint
+_STAGE_INPUTS = {
+    "rendered": ("d.sha256, p.page_no", "JOIN documents d ON d.id = p.document_id"),
+    "labelled": (
+        "pd.sha256, CASE WHEN p.left_source_v2 LIKE 'ocr:%' THEN pl.sha256 END",
+        "LEFT JOIN page_derivatives pd ON pd.page_id = p.id AND pd.kind = 'llm' "
+        "LEFT JOIN page_derivatives pl ON pl.page_id = p.id AND pl.kind = 'left'",
+    ),
+    "indexed": ("NULL, NULL", ""),
+}
+
+
+def current_fingerprint(stage: str, a, b) -> str:
+    if stage == "rendered":
+        return render_fingerprint(a, b)
+    if stage == "labelled":
+        return ocr_label_fingerprint(b) if b else label_fingerprint(a)
+    return index_fingerprint()
+
+
+def stale_pages(con, stage: str, document_id: int | None = None, include_unknown: bool = False) -> list:
+    """Sider hvis 'stage' er gemt med et andet fingerprint end det aktuelle.
+
+    Sider uden fingerprint (fra før det blev gemt) tælles kun med include_unknown.
+    Returnerer [(page_id, document_id)].
+    """
+    cols, join = _STAGE_INPUTS[stage]
+    sql = f"""
+        SELECT p.id, p.document_id, s.fingerprint, {cols}
+        FROM page_stages s
+        JOIN pages p ON p.id = s.page_id
+        {join}
+        WHERE s.stage = ?
+    """
+    params = [stage]
+    if document_id is not None:
+        sql += " AND p.document_id = ?"
+        params.append(document_id)
+
+    out = []
+    for page_id, doc_id, fp, a, b in con.execute(sql, params):
+        if fp is None:
+            if include_unknown:
+                out.append((page_id, doc_id))
+        elif fp != current_fingerprint(stage, a, b):
+            out.append((page_id, doc_id))
+    return out
+
+
+# ---------- rendering (kører i worker-processer) ----------
+
+_worker_doc = None
+
+
+def _init_worker(pdf_path: str):
+    # hver worker åbner sit eget fitz-dokument én gang og genbruger det
+    global _worker_doc
+    import fitz  # PyMuPDF
+    _worker_doc = fitz.open(pdf_path)
+
+
+def render_pages(page_idxs: list[int], doc=None) -> list[tuple[int, dict, dict]]:
+    """Render 0-baserede sideindeks én gang hver og lav alle afledte billeder.
+
+    doc er None i worker-processerne (de bruger _worker_doc).
+    Returnerer [(idx, {kind: (rel_path, sha256)}, meta)], se derivatives.render_page.
+    """
+    from derivatives import render_page
+
+    doc = doc or _worker_doc
+    out = []
+    for i in page_idxs:
+        derived, meta = render_page(doc.load_page(i))
+        out.append((i, derived, meta))
+    return out
+
+
+def render_all(pdf_path: Path, page_idxs: list[int], workers: int):
+    """Yield (idx, derived, meta) efterhånden som siderne bliver færdige."""
+    chunks = [page_idxs[i:i + CHUNK_PAGES] for i in range(0, len(page_idxs), CHUNK_PAGES)]
+
+    if workers <= 1 or len(chunks) <= 1:
+        # eget dokument: flere import-jobs kan rendere samtidigt i web-appens tråde
+        import fitz  # PyMuPDF
+        doc = fitz.open(str(pdf_path))
+        try:
+            for chunk in chunks:
+                yield from render_pages(chunk, doc)
+        finally:
+            doc.close()
+        return
+
+    # spawn: kaldes også fra web-appens tråde, hvor fork ikke er sikkert
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(str(pdf_path),),
+    ) as pool:
+        futures = [pool.submit(render_pages, chunk) for chunk in chunks]
+        for fut in as_completed(futures):
+            yield from fut.result()
+
+
+# ---------- trin ----------
+
+def _unrendered(con, document_id: int) -> list:
+    return con.execute("""
+        SELECT p.id, p.page_no FROM pages p
+        WHERE p.document_id = ?
+          AND NOT EXISTS (SELECT 1 FROM page_stages s WHERE s.page_id = p.id AND s.stage = 'rendered')
+        ORDER BY p.page_no
+    """, (document_id,)).fetchall()
+
+
+def render(con, document_id: int, workers: int | None = None):
+    """Render de sider i dokumentet der ikke er 'rendered' i page_stages.
+
+    Hver side skrives sammen med sin 'rendered'-række, så en afbrudt
+    rendering fortsætter hvor den slap; et færdigt dokument koster én forespørgsel.
+    """
+    from archive_db import mark_stage
+    from thumb_pack import register as register_blobs, writing as pack_writing
+
+    todo = _unrendered(con, document_id)
+    if not todo:
+        return
+    pdf_path, pdf_sha256 = con.execute(
+        "SELECT path, sha256 FROM documents WHERE id = ?", (document_id,)
+    ).fetchone()
+    total = con.execute("SELECT COUNT(*) FROM pages WHERE document_id = ?", (document_id,)).fetchone()[0]
+    page_ids = {r["page_no"] - 1: r["id"] for r in todo}
+    workers = workers or os.cpu_count() or 1
+
+    # rendering fordeles på processer; kun denne tråd skriver til DB.
+    # Thumbnails ligger i pakkefilen (thumb_pack.py); pages.thumb_path forbliver NULL.
+    # writing(): compact venter til blobs fra denne rendering er committet
+    with pack_writing():
+        cur = con.cursor()
+        done = total - len(todo)
+        for idx, derived, meta in render_all(Path(pdf_path), sorted(page_ids), workers):
+            page_id = page_ids[idx]
+            cur.execute(
+                "UPDATE pages SET phash=?, lqip=?, aspect=? WHERE id=?",
+                (meta["phash"], meta["lqip"], meta["aspect"], page_id),
+            )
+            register_blobs(cur, meta["blobs"])
+            cur.executemany(
+                "INSERT OR REPLACE INTO page_derivatives(page_id, kind, path, sha256) VALUES(?, ?, ?, ?)",
+                [(page_id, kind, path, sha) for kind, (path, sha) in derived.items()],
+            )
+            mark_stage(cur, "rendered", [page_id], render_fingerprint(pdf_sha256, idx + 1))
+            done += 1
+            if done % COMMIT_EVERY == 0:
+                con.commit()
+            yield {"stage": "ingest", "event": "progress", "i": done, "n": total}
+        con.commit()
+
+
+def ingest(con, src_pdf: Path, workers: int | None = None, sha256: str | None = None):
+    """Læg PDF'en i data/pdfs, opret documents/pages og render alle sider.
+
+    Ligger src_pdf allerede i data/pdfs (web-upload), bruges filen som den er.
+    Findes samme indhold (sha256) i arkivet, yieldes kun et 'duplicate'-event,
+    medmindre dokumentet har sider der ikke er renderet (afbrudt import):
+    så fortsættes renderingen ('document' med resumed=True).
+    """
+    import fitz  # PyMuPDF
+    from archive_db import file_sha256
+
+    src_pdf = Path(src_pdf)
+
+    if src_pdf.resolve().parent == PDFS_DIR.resolve():
+        dst_pdf, tmp = src_pdf, None
+        sha256 = sha256 or file_sha256(src_pdf)
+    else:
+        with open(src_pdf, "rb") as f:
+            tmp, sha256 = receive_pdf(f)
+
+    dup = find_document_by_sha256(con, sha256)
+    if dup is None and tmp is not None:
+        dst_pdf = place_pdf(tmp, src_pdf.name)
+
+    cur = con.cursor()
+    if dup is None:
+        try:
+            cur.execute(
+                "INSERT INTO documents(path, filename, sha256) VALUES(?, ?, ?)",
+                (str(dst_pdf), dst_pdf.name, sha256),
+            )
+        except sqlite3.IntegrityError:
+            # samme fil importeret samtidigt af et andet job
+            con.rollback()
+            dup = find_document_by_sha256(con, sha256)
+    if dup is not None:
+        # kun filen dette kald selv har modtaget slettes; en fil der allerede lå i
+        # data/pdfs kan være et andet dokument (fx en dublet uden sha256) eller en
+        # web-upload, som run_import_job selv rydder op efter
+        if tmp is not None and tmp.exists():
+            tmp.unlink()
+        if not _unrendered(con, dup["id"]):
+            yield {"stage": "ingest", "event": "duplicate", "document_id": dup["id"], "filename": dup["filename"]}
+            return
+        total = con.execute("SELECT COUNT(*) FROM pages WHERE document_id = ?", (dup["id"],)).fetchone()[0]
+        yield {"stage": "ingest", "event": "document", "document_id": dup["id"], "pages": total, "resumed": True}
+        yield from render(con, dup["id"], workers)
+        yield {"stage": "ingest", "event": "done", "document_id": dup["id"]}
+        return
+    document_id = cur.lastrowid
+
+    doc = fitz.open(str(dst_pdf))
+    total = doc.page_count
+    doc.close()
+
+    # dokument og sider i samme transaktion: enten findes alle sider, eller ingen
+    cur.executemany(
+        "INSERT INTO pages(document_id, page_no, text, thumb_path) VALUES(?, ?, ?, ?)",
+        [(document_id, i + 1, "", None) for i in range(total)],
+    )
+    con.commit()
+
+    yield {"stage": "ingest", "event": "document", "document_id": document_id, "pages": total}
+    yield from render(con, document_id, workers)
+    yield {"stage": "ingest", "event": "done", "document_id": document_id}
+
+
+def backfill_phash(con) -> int:
+    """pages.phash for sider importeret før ingest beregnede den. Returnerer antal."""
+    from PIL import Image
+
+    import llm_left_labels_v2 as v2
+    from derivatives import resolve
+    from phash import dhash, left_dhash
+
+    rows = con.execute("""
+        SELECT p.id, p.thumb_path, pd.path AS left_path
+        FROM pages p
+        LEFT JOIN page_derivatives pd ON pd.page_id = p.id AND pd.kind = 'left'
+        WHERE p.phash IS NULL
+    """).fetchall()
+    n = 0
+    for r in rows:
+        # samme billede som ingest hasher: 'left' er allerede venstre halvdel,
+        # den gamle PNG-thumbnail er hele opslaget
+        left = resolve(r["left_path"])
+        src = left or v2.resolve_thumb(r["thumb_path"])
+        if not src:
+            continue
+        with Image.open(src) as img:
+            h = dhash(img) if left else left_dhash(img)
+        con.execute("UPDATE pages SET phash = ? WHERE id = ?", (h, r["id"]))
+        n += 1
+        if n % COMMIT_EVERY == 0:
+            con.commit()
+    con.commit()
+    return n
+
+
+# sider hvis labels kan arves (titler fundet af LLM'en eller selv arvet)
+# (kun sider hvis labels stadig gælder; arkiv.py rebuild fjerner 'labelled' fra forældede)
+_LABELLED_SQL = """
+    SELECT id, phash FROM pages p
+    WHERE phash IS NOT NULL
+      AND (left_source_v2 LIKE 'llm:v2%' OR left_source_v2 LIKE 'phash:v2:%')
+      AND COALESCE(left_titles_json_v2, '[]') <> '[]'
+      AND EXISTS (SELECT 1 FROM page_stages s WHERE s.page_id = p.id AND s.stage = 'labelled')
+"""
+
+
+def copy_labels(con, page_id: int, src_id: int, fingerprint: str | None = None):
+    """Giv page_id samme v2-labels som src_id; left_source_v2 = 'phash:v2:<src_id>'."""
+    from archive_db import mark_stage
+
+    con.execute("""
+        UPDATE pages
+        SET (left_titles_json_v2, left_nr_v2, left_scale_v2, left_confidence_v2, left_search_text_v2) = (
+                SELECT left_titles_json_v2, left_nr_v2, left_scale_v2, left_confidence_v2, left_search_text_v2
+                FROM pages WHERE id = ?
+            ),
+            left_source_v2 = ?
+        WHERE id = ?
+    """, (src_id, f"phash:v2:{src_id}", page_id))
+    mark_stage(con, "labelled", [page_id], fingerprint)
+    con.commit()
+
+
+def enrich(con, document_id: int | None = None, concurrency: int | None = None,
+           rpm: int | None = None, tpm: int | None = None, page_ids: list[int] | None = None,
+           ocr_threshold: float | None = None):
+    """LLM-labels (v2) for renderede sider der ikke er 'labelled' (ét dokument eller alle).
+
+    En side hvis phash ligger tæt på en allerede labelet side (phash.BKTree)
+    arver dens labels uden API-kald. Sider der ligner en anden side i samme
+    kørsel venter på den og arver bagefter.
+
+    phash'en ser kun tegningen: sider der kun adskiller sig i tekst (fx et
+    andet "Nr."), ligger ofte 0-1 bit fra hinanden. Før en side arver,
+    OCR'es dens nr (ocr_labels.read_nr) og sammenlignes med kildens
+    left_nr_v2; kan det ikke læses (ingen 'left'-afledning, tesseract
+    mangler), går siden til LLM'en i stedet.
+
+    Med ocr_threshold læses siden først lokalt (ocr_labels.py); kun sider
+    hvis OCR-confidence er under tærsklen, sendes til LLM'en.
+
+    rpm/tpm=None bruger de delte grænser i llm_left_labels_v2, så samtidige
+    jobs i samme proces deler rate limit; med rpm/tpm får kørslen sine egne.
+    page_ids begrænser til de sider.
+    """
+    import llm_left_labels_v2 as v2
+    import ocr_labels
+    from derivatives import resolve
+    from phash import BKTree
+
+    # egne grænser gælder kun denne kørsel; v2.LIMITS deles af de øvrige jobs
+    limits = None
+    if rpm is not None or tpm is not None:
+        limits = v2.Limits(
+            v2.DEFAULT_RPM if rpm is None else rpm,
+            v2.DEFAULT_TPM if tpm is None else tpm,
+        )
+    concurrency = max(1, concurrency or v2.DEFAULT_CONCURRENCY)
+
+    backfill_phash(con)
+    known = BKTree()
+    for r in con.execute(_LABELLED_SQL):
+        known.add(r["phash"], r["id"])
+
+    # renderede sider uden 'labelled'; fejlede sider har intet trin og tages med igen
+    sql = """
+        SELECT p.id, p.page_no, p.thumb_path, p.phash, pd.path AS llm_path, pd.sha256 AS llm_sha,
+               pl.path AS left_path, pl.sha256 AS left_sha
+        FROM pages p
+        JOIN page_stages r ON r.page_id = p.id AND r.stage = 'rendered'
+        LEFT JOIN page_derivatives pd ON pd.page_id = p.id AND pd.kind = 'llm'
+        LEFT JOIN page_derivatives pl ON pl.page_id = p.id AND pl.kind = 'left'
+        WHERE NOT EXISTS (SELECT 1 FROM page_stages s WHERE s.page_id = p.id AND s.stage = 'labelled')
+    """
+    params = []
+    if document_id is not None:
+        sql += " AND p.document_id = ?"
+        params.append(document_id)
+    if page_ids is not None:
+        sql += " AND p.id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(page_ids)))
+    rows = con.execute(sql + " ORDER BY p.id", params).fetchall()
+
+    total = len(rows)
+    yield {"stage": "enrich", "event": "start", "n": total, "document_id": document_id}
+
+    start = time.monotonic()
+    before = v2.STATS.snapshot()
+    counts = {"ok": 0, "error": 0, "missing": 0, "reused": 0}
+    cascade = {"ocr": 0, "escalated": 0, "ocr_error": None}
+    done = 0
+
+    def page_event(r, status, **kw):
+        nonlocal done
+        done += 1
+        counts[status] += 1
+        return {"stage": "enrich", "event": "page", "i": done, "n": total,
+                "page_id": r["id"], "page_no": r["page_no"], "status": status, **kw}
+
+    nrs = {}  # page_id -> OCR'et nr (None = kunne ikke læses)
+
+    def page_nr(r):
+        if r["id"] not in nrs:
+            left = resolve(r["left_path"])
+            try:
+                nrs[r["id"]] = ocr_labels.read_nr(left) if left else None
+            except Exception:  # fx tesseract ikke installeret
+                nrs[r["id"]] = None
+        return nrs[r["id"]]
+
+    def try_reuse(r):
+        hits = known.search(r["phash"]) if r["phash"] else []
+        if not hits or page_nr(r) is None:
+            return None
+        # nærmeste kilde med samme nr
+        for dist, src_id in hits:
+            src_nr = con.execute("SELECT left_nr_v2 FROM pages WHERE id = ?", (src_id,)).fetchone()[0]
+            if ocr_labels.nr_digits(src_nr) == page_nr(r):
+                break
+        else:
+            return None
+        copy_labels(con, r["id"], src_id, label_fingerprint(r["llm_sha"]))
+        known.add(r["phash"], r["id"])
+        return page_event(r, "reused", source_page_id=src_id, distance=dist)
+
+    def label_page(thumb, llm_image, left_image):
+        # worker: OCR først (hvis slået til); under tærsklen eller ved fejl tager LLM'en over.
+        # Returnerer (svar, kilde, OCR-fejl eller None).
+        ocr_error = None
+        if ocr_threshold is not None and left_image:
+            try:
+                out = ocr_labels.read_labels(left_image)
+                if out["confidence"] >= ocr_threshold:
+                    return out, "ocr", None
+            except Exception as e:  # fx tesseract ikke installeret
+                ocr_error = f"{type(e).__name__}: {e}"
+        return v2.enrich_page(thumb, llm_image, limits), "llm", ocr_error
+
+    def run_llm(batch):
+        # workers laver OCR/billede + API-kald; kun denne tråd skriver til SQLite
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {}
+            for r in batch:
+                llm_image = resolve(r["llm_path"])
+                thumb = None if llm_image else v2.resolve_thumb(r["thumb_path"])
+                if not llm_image and not thumb:
+                    yield page_event(r, "missing")
+                    continue
+                futures[pool.submit(label_page, thumb, llm_image, resolve(r["left_path"]))] = r
+
+            for fut in as_completed(futures):
+                r = futures[fut]
+                try:
+                    out, source, ocr_error = fut.result()
+                    if ocr_threshold is not None:
+                        cascade["ocr" if source == "ocr" else "escalated"] += 1
+                        cascade["ocr_error"] = cascade["ocr_error"] or ocr_error
+                    if source == "ocr":
+                        conf = v2.save_result(con, r["id"], out, ocr_label_fingerprint(r["left_sha"]),
+                                              source=f"ocr:v{ocr_labels.OCR_VERSION}")
+                    else:
+                        conf = v2.save_result(con, r["id"], out, label_fingerprint(r["llm_sha"]))
+                except Exception as e:
+                    con.execute(
+                        "UPDATE pages SET left_source_v2=? WHERE id=?",
+                        (f"llm_error_v2:{type(e).__name__}", r["id"]),
+                    )
+                    con.commit()
+                    yield page_event(r, "error", error=str(e))
+                    continue
+                # kun LLM-labels arves (OCR giver kun hovedtitlen)
+                if source == "llm" and r["phash"] and con.execute(
+                    "SELECT COALESCE(left_titles_json_v2, '[]') <> '[]' FROM pages WHERE id = ?", (r["id"],)
+                ).fetchone()[0]:
+                    known.add(r["phash"], r["id"])
+                yield page_event(r, "ok", conf=conf, source=source)
+
+    to_llm, waiting = [], []
+    in_flight = BKTree()
+    for r in rows:
+        ev = try_reuse(r)
+        if ev:
+            yield ev
+        elif r["phash"] and in_flight.nearest(r["phash"]):
+            waiting.append(r)
+        else:
+            if r["phash"]:
+                in_flight.add(r["phash"], r["id"])
+            to_llm.append(r)
+
+    yield from run_llm(to_llm)
+
+    # sider der lignede en side fra denne kørsel; arv hvis den fik labels, ellers LLM
+    retry = []
+    for r in waiting:
+        ev = try_reuse(r)
+        if ev:
+            yield ev
+        else:
+            retry.append(r)
+    yield from run_llm(retry)
+
+    # STATS er fælles for processen; deltaet er denne kørsels andel
+    after = v2.STATS.snapshot()
+    yield {"stage": "enrich", "event": "done", "ok": counts["ok"], "errors": counts["error"],
+           "missing": counts["missing"], "reused": counts["reused"],
+           "ocr": cascade["ocr"], "escalated": cascade["escalated"], "ocr_error": cascade["ocr_error"],
+           "elapsed": time.monotonic() - start, "concurrency": concurrency,
+           "stats": {k: after[k] - before[k] for k in after}}
+
+
+def index(con, document_id: int, force: bool = False):
+    """Notér dokumentets labelede sider som 'indexed'.
+
+    Triggers i schema.sql holder left_fts/left_trgm opdateret ved hver
+    label-commit, så trinnet er kun bogføring. force genopbygger dokumentets
+    rækker med reindex_left_fts (arkiv.py rebuild og reparation fra CLI).
+    """
+    from archive_db import mark_stage, reindex_left_fts
+
+    total = con.execute(
+        "SELECT COUNT(*) FROM pages WHERE document_id = ?", (document_id,)
+    ).fetchone()[0]
+    labelled = [r[0] for r in con.execute("""
+        SELECT p.id FROM pages p
+        JOIN page_stages s ON s.page_id = p.id AND s.stage = 'labelled'
+        WHERE p.document_id = ?
+          AND NOT EXISTS (SELECT 1 FROM page_stages i WHERE i.page_id = p.id AND i.stage = 'indexed')
+    """, (document_id,))]
+    inserted = reindex_left_fts(con, document_id) if force else len(labelled)
+    if labelled:
+        mark_stage(con, "indexed", labelled, index_fingerprint())
+    con.commit()
+    yield {"stage": "index", "event": "done", "document_id": document_id,
+           "inserted": inserted, "skipped": total - inserted}
+
+
+def run_import(con, src_pdf: Path | None, category: str | None = None,
+               document_id: int | None = None, workers: int | None = None,
+               sha256: str | None = None):
+    """Hele importen. Med document_id springes ingest over (genoptagelse);
+    hvert trin laver kun de sider der mangler i page_stages.
+
+    Er PDF'en allerede i arkivet, sættes kun kategorien på det eksisterende dokument.
+    """
+    if document_id is None:
+        duplicate = False
+        for ev in ingest(con, src_pdf, workers=workers, sha256=sha256):
+            if ev["event"] in ("document", "duplicate"):
+                document_id = ev["document_id"]
+                duplicate = ev["event"] == "duplicate"
+            yield ev
+        if category:
+            con.execute("UPDATE documents SET category = ? WHERE id = ?", (category, document_id))
+            con.commit()
+        if duplicate:
+            return
+    else:
+        # genoptagelse: sider der ikke nåede at blive renderet, renderes nu
+        yield from render(con, document_id, workers)
+
+    # page_stages: færdige sider springes over, fejlede sider prøves igen
+    yield from enrich(con, document_id, ocr_threshold=OCR_THRESHOLD)
+    yield from index(con, document_id)
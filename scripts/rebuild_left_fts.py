@@ -2,6 +2,8 @@ import json
 import sqlite3
 from pathlib import Path
 
+from archive_db import ensure_schema, refresh_page_labels
+
 DB = Path("app/app.db")
 
 def parse_titles(s):
@@ -18,6 +20,7 @@ def parse_titles(s):
 def main():
     con = sqlite3.connect(DB)
     con.row_factory = sqlite3.Row
+    ensure_schema(con)
 
     rows = con.execute("""
         SELECT
@@ -46,24 +49,25 @@ def main():
         con.execute("UPDATE pages SET left_search_text_v2=? WHERE id=?", (text, r["id"]))
         updated += 1
 
+    # 2) genberegn visningslabels (page_labels) for alle sider;
+    #    triggers på page_labels opdaterer left_fts + left_trgm i samme transaktion
+    labels = refresh_page_labels(con)
     con.commit()
 
-    # 2) rebuild left_fts contentless
-    con.execute("DELETE FROM left_fts;")
-    con.execute("""
-        INSERT INTO left_fts(rowid, left_search_text)
-        SELECT id, COALESCE(left_search_text_v2,'')
-        FROM pages
-        WHERE COALESCE(left_search_text_v2,'') <> '';
-    """)
+    # 3) flet FTS-segmenterne efter den store omskrivning
+    con.execute("INSERT INTO left_fts(left_fts) VALUES('optimize');")
+    con.execute("INSERT INTO left_trgm(left_trgm) VALUES('optimize');")
     con.commit()
 
     # sanity
     c_pages = con.execute("SELECT COUNT(*) FROM pages;").fetchone()[0]
     c_fts = con.execute("SELECT COUNT(*) FROM left_fts;").fetchone()[0]
+    c_trgm = con.execute("SELECT COUNT(*) FROM left_trgm;").fetchone()[0]
     print(f"pages: {c_pages}")
     print(f"left_fts rows: {c_fts}")
+    print(f"left_trgm rows: {c_trgm}")
     print(f"updated left_search_text_v2: {updated}")
+    print(f"page_labels rows: {labels}")
 
     con.close()
 
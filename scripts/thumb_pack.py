@@ -0,0 +1,310 @@
+"""Pakkefil til thumbnails: én append-only fil i stedet for en fil pr. side.
+
+Blobs (WebP-stigen thumb160/320/640) skrives i forlængelse af hinanden i
+data/packs/thumbs-<gen>.pack. Tabellen pack_blobs (sha256 -> pack, offset,
+length) er indekset; page_derivatives.path er PACK_PATH for pakkede kinds,
+så opslaget går via sha256.
+
+  - append() kan kaldes fra render-processerne; flock på data/packs/.lock
+    serialiserer skrivninger på tværs af processer
+  - den der registrerer blobs, holder writing() (delt flock på
+    data/packs/.writers) fra før første append til efter commit; compact
+    tager den eksklusivt og venter derfor på blobs der er skrevet men
+    endnu ikke committet i pack_blobs
+  - PackReader mapper pakkerne med mmap og returnerer memoryview-slices,
+    som web-appen sender uden at kopiere
+  - compact skriver de levende blobs til en ny generation og sletter de
+    gamle filer; en læser der stadig har den gamle fil mappet, kan læse
+    færdig (filen forsvinder først når den lukkes)
+  - løse afledninger i data/derived deles mellem sider med samme indhold;
+    release_derived (ved sletning af en side) og gc sletter dem, når ingen
+    page_derivatives-række peger på dem længere. Også det kræver .writers
+    eksklusivt: en rendering kan have genbrugt en eksisterende fil uden
+    at have committet rækken endnu
+
+    python scripts/thumb_pack.py migrate [--drop-png]
+    python scripts/thumb_pack.py compact [--force]
+    python scripts/thumb_pack.py gc
+    python scripts/thumb_pack.py stats
+"""
+import argparse
+import fcntl
+import mmap
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / "app" / "app.db"
+PACK_DIR = ROOT / "data" / "packs"
+THUMBS_DIR = ROOT / "data" / "thumbs"
+PACK_PATH = "pack"  # page_derivatives.path for blobs der ligger i pakken
+PACKED_KINDS = ("thumb160", "thumb320", "thumb640")
+COMMIT_EVERY = 200
+
+_PACK_RE = re.compile(r"^thumbs-(\d+)\.pack$")
+
+
+@contextmanager
+def _locked(name: str = ".lock", mode: int = fcntl.LOCK_EX):
+    PACK_DIR.mkdir(parents=True, exist_ok=True)
+    with open(PACK_DIR / name, "a") as f:
+        fcntl.flock(f, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def writing():
+    """Hold fra før append() til pack_blobs er committet; compact venter imens."""
+    return _locked(".writers", fcntl.LOCK_SH)
+
+
+def _generations() -> list[int]:
+    return sorted(int(m.group(1)) for p in PACK_DIR.glob("thumbs-*.pack") if (m := _PACK_RE.match(p.name)))
+
+
+def _pack_name(gen: int) -> str:
+    return f"thumbs-{gen}.pack"
+
+
+def append(data: bytes) -> tuple[str, int, int]:
+    """Skriv data sidst i den aktuelle pakke. Returnerer (pack, offset, length)."""
+    with _locked():
+        gens = _generations()
+        name = _pack_name(gens[-1] if gens else 1)
+        with open(PACK_DIR / name, "ab") as f:
+            offset = f.tell()
+            f.write(data)
+    return name, offset, len(data)
+
+
+def register(con, blobs):
+    """Indsæt [(sha256, pack, offset, length)] i pack_blobs (samme indhold gemmes kun én gang)."""
+    con.executemany(
+        "INSERT OR IGNORE INTO pack_blobs(sha256, pack, offset, length) VALUES(?, ?, ?, ?)",
+        blobs,
+    )
+
+
+class PackReader:
+    """mmap af pakkefilerne; genmappes når en pakke er vokset siden sidst.
+
+    Når en ny generation mappes (efter compact), slippes maps af de ældre, så
+    de slettede filers diskplads frigives uden genstart.
+    """
+
+    def __init__(self):
+        self.maps = {}
+        self.lock = threading.Lock()
+
+    def _map(self, pack: str, need: int):
+        with self.lock:
+            mm = self.maps.get(pack)
+            if mm is not None and len(mm) >= need:
+                return mm
+            try:
+                with open(PACK_DIR / Path(pack).name, "rb") as f:
+                    if os.fstat(f.fileno()).st_size < need:
+                        return None  # afbrudt skrivning; blob'en findes ikke (endnu)
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                return None
+            # den gamle map lukkes af GC når ingen svar længere peger ind i den
+            self.maps[pack] = mm
+            self._drop_older(pack)
+            return mm
+
+    def _drop_older(self, pack: str):
+        # compact sletter alle generationer før den nye; pack_blobs peger ikke længere på dem
+        m = _PACK_RE.match(pack)
+        if not m:
+            return
+        for name in list(self.maps):
+            old = _PACK_RE.match(name)
+            if old and int(old.group(1)) < int(m.group(1)) and not (PACK_DIR / name).exists():
+                del self.maps[name]
+
+    def get(self, pack: str, offset: int, length: int) -> memoryview | None:
+        mm = self._map(pack, offset + length)
+        if mm is None:
+            return None
+        return memoryview(mm)[offset:offset + length]
+
+
+def connect_db():
+    con = sqlite3.connect(DB_PATH, timeout=60)
+    con.row_factory = sqlite3.Row
+    return con
+
+
+def migrate(con, drop_png: bool = False) -> tuple[int, int]:
+    """Flyt løse WebP-thumbnails (data/derived) ind i pakken.
+
+    Med drop_png slettes også PNG'en i data/thumbs for sider der har
+    WebP-stigen, en llm-afledning og en left-afledning (som
+    build_titles_and_numbers.py læser nr fra), så intet længere læser den.
+    Returnerer (antal flyttede blobs, antal slettede PNG'er).
+    """
+    from derivatives import resolve
+
+    with writing():
+        rows = con.execute(f"""
+            SELECT page_id, kind, path, sha256 FROM page_derivatives
+            WHERE kind IN ({",".join("?" * len(PACKED_KINDS))}) AND path <> ?
+        """, (*PACKED_KINDS, PACK_PATH)).fetchall()
+        packed = {r[0] for r in con.execute("SELECT sha256 FROM pack_blobs")}
+        moved, loose = 0, set()
+        for r in rows:
+            src = resolve(r["path"])
+            if r["sha256"] not in packed:
+                if src is None:
+                    continue  # filen mangler; build_thumb_ladder.py laver den igen
+                register(con, [(r["sha256"], *append(src.read_bytes()))])
+                packed.add(r["sha256"])
+                moved += 1
+            con.execute(
+                "UPDATE page_derivatives SET path = ? WHERE page_id = ? AND kind = ?",
+                (PACK_PATH, r["page_id"], r["kind"]),
+            )
+            if src is not None:
+                loose.add(src)
+            if moved and moved % COMMIT_EVERY == 0:
+                con.commit()
+        con.commit()
+    # samme fil kan deles af flere sider; slet først når alle peger på pakken
+    for p in loose:
+        p.unlink(missing_ok=True)
+
+    dropped = 0
+    if drop_png:
+        rows = con.execute(f"""
+            SELECT p.id, p.thumb_path FROM pages p
+            WHERE p.thumb_path IS NOT NULL
+              AND EXISTS (SELECT 1 FROM page_derivatives pd WHERE pd.page_id = p.id AND pd.kind = 'llm')
+              AND EXISTS (SELECT 1 FROM page_derivatives pd WHERE pd.page_id = p.id AND pd.kind = 'left')
+              AND (SELECT COUNT(*) FROM page_derivatives pd
+                   WHERE pd.page_id = p.id AND pd.path = ? AND pd.kind IN ({",".join("?" * len(PACKED_KINDS))})) = ?
+        """, (PACK_PATH, *PACKED_KINDS, len(PACKED_KINDS))).fetchall()
+        for r in rows:
+            con.execute("UPDATE pages SET thumb_path = NULL WHERE id = ?", (r["id"],))
+            (THUMBS_DIR / Path(r["thumb_path"]).name).unlink(missing_ok=True)
+            dropped += 1
+        con.commit()
+    return moved, dropped
+
+
+def compact(con) -> tuple[int, int]:
+    """Skriv de blobs der stadig bruges til en ny pakke og slet de gamle.
+
+    Returnerer (bytes før, bytes efter).
+    """
+    # først .writers, så .lock (samme rækkefølge som skriverne): ingen halvt registrerede blobs
+    with _locked(".writers"), _locked():
+        gens = _generations()
+        before = sum((PACK_DIR / _pack_name(g)).stat().st_size for g in gens)
+        con.execute("""
+            DELETE FROM pack_blobs
+            WHERE sha256 NOT IN (SELECT sha256 FROM page_derivatives WHERE path = ?)
+        """, (PACK_PATH,))
+        rows = con.execute("SELECT sha256, pack, offset, length FROM pack_blobs ORDER BY pack, offset").fetchall()
+
+        new_name = _pack_name((gens[-1] if gens else 0) + 1)
+        reader = PackReader()
+        new_rows = []
+        with open(PACK_DIR / new_name, "wb") as out:
+            for r in rows:
+                data = reader.get(r["pack"], r["offset"], r["length"])
+                if data is None:
+                    continue  # rækken peger på en ufuldstændig skrivning
+                new_rows.append((new_name, out.tell(), r["sha256"]))
+                out.write(data)
+            out.flush()
+            os.fsync(out.fileno())
+        con.executemany("UPDATE pack_blobs SET pack = ?, offset = ? WHERE sha256 = ?", new_rows)
+        con.execute("DELETE FROM pack_blobs WHERE pack <> ?", (new_name,))
+        con.commit()
+        reader.maps.clear()
+        for g in gens:
+            (PACK_DIR / _pack_name(g)).unlink(missing_ok=True)
+        after = (PACK_DIR / new_name).stat().st_size
+    return before, after
+
+
+def _sweep_derived(con, rel_paths=None) -> int:
+    # kalderen holder .writers eksklusivt; rel_paths=None gennemgår hele data/derived
+    from derivatives import DERIVED_DIR
+
+    used = {r[0] for r in con.execute("SELECT DISTINCT path FROM page_derivatives")}
+    if rel_paths is None:
+        # *.tmp er rester af afbrudte skrivninger; ingen skriver kører nu
+        rel_paths = [p.relative_to(ROOT).as_posix() for p in DERIVED_DIR.glob("*/*")]
+    n = 0
+    for rel in set(rel_paths) - used - {PACK_PATH}:
+        p = ROOT / rel
+        if p.is_file():
+            p.unlink(missing_ok=True)
+            n += 1
+    return n
+
+
+def release_derived(con, rel_paths) -> int | None:
+    """Slet de løse afledninger i rel_paths som ingen side bruger længere (kald efter commit).
+
+    Kører en rendering (writing() holdes), ventes der ikke: None returneres,
+    og filerne bliver liggende til næste gc. Ellers antal slettede filer.
+    """
+    try:
+        with _locked(".writers", fcntl.LOCK_EX | fcntl.LOCK_NB):
+            return _sweep_derived(con, rel_paths)
+    except BlockingIOError:
+        return None
+
+
+def gc(con) -> int:
+    """Slet alle filer i data/derived som ingen page_derivatives-række peger på. Returnerer antal."""
+    with _locked(".writers"):
+        return _sweep_derived(con)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_migrate = sub.add_parser("migrate")
+    p_migrate.add_argument("--drop-png", action="store_true")
+    p_compact = sub.add_parser("compact")
+    p_compact.add_argument("--force", action="store_true")
+    sub.add_parser("gc")
+    sub.add_parser("stats")
+    args = parser.parse_args()
+
+    from archive_db import ensure_schema
+
+    con = connect_db()
+    ensure_schema(con)
+
+    if args.cmd == "migrate":
+        moved, dropped = migrate(con, drop_png=args.drop_png)
+        print(f"Packed: {moved} blobs, removed {dropped} PNG thumbnails")
+    elif args.cmd == "compact":
+        # en import der kører nu, kan have skrevet til pakken uden at have registreret det endnu
+        running = con.execute("SELECT COUNT(*) FROM import_jobs WHERE status = 'running'").fetchone()[0]
+        if running and not args.force:
+            raise SystemExit(f"{running} import job(s) running; wait or use --force")
+        before, after = compact(con)
+        print(f"Compacted: {before} -> {after} bytes")
+    elif args.cmd == "gc":
+        print(f"Removed {gc(con)} unreferenced derived files")
+    else:
+        n, live = con.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM pack_blobs").fetchone()
+        size = sum((PACK_DIR / _pack_name(g)).stat().st_size for g in _generations())
+        print(f"Blobs: {n}, live bytes: {live}, pack bytes: {size}")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
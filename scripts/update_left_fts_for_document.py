@@ -1,6 +1,9 @@
 import sqlite3
 from pathlib import Path
 
+from archive_db import ensure_schema
+from pipeline import index
+
 ROOT = Path(__file__).resolve().parents[1]
 DB = ROOT / "app" / "app.db"
 
@@ -18,39 +21,15 @@ def main():
     document_id = int(sys.argv[1])
 
     con = connect()
-    cur = con.cursor()
-
-    rows = cur.execute("""
-        SELECT id, left_search_text_v2
-        FROM pages
-        WHERE document_id = ?
-        ORDER BY id
-    """, (document_id,)).fetchall()
-
-    updated = 0
-    skipped = 0
-
-    for r in rows:
-        page_id = int(r["id"])
-        txt = (r["left_search_text_v2"] or "").strip()
-
-        # Sørg for at vi ikke har en gammel række
-        cur.execute("DELETE FROM left_fts WHERE rowid = ?", (page_id,))
-
-        # Kun indsæt hvis vi faktisk har tekst
-        if txt:
-            cur.execute(
-                "INSERT INTO left_fts(rowid, left_search_text) VALUES(?, ?)",
-                (page_id, txt),
-            )
-            updated += 1
-        else:
-            skipped += 1
-
-    con.commit()
-    con.close()
+    ensure_schema(con)
 
-    print(f"FTS updated for document_id={document_id}: inserted={updated}, skipped_empty={skipped}")
+    # Normalt unødvendigt: triggers holder left_fts opdateret ved hver commit.
+    # Bruges til reparation – sletter dokumentets rækker og indsætter dem igen;
+    # sider uden labels kommer ikke med i left_fts_src
+    for ev in index(con, document_id, force=True):
+        print(f"FTS updated for document_id={document_id}: inserted={ev['inserted']}, skipped_empty={ev['skipped']}")
+
+    con.close()
 
 if __name__ == "__main__":
     main()